@@ -0,0 +1,201 @@
+"""
+Replays recorded sell sessions without a game window, and reports the latency of each step of the sell
+process and the detection accuracy against the recorded ground truth.
+
+Sessions are recorded by setting "RECORD_SESSIONS" to true in config.json: each hotkey press is then saved
+to res/debug/sessions/. The detections saved in each session.json are used as ground truth, and can be
+corrected by hand.
+
+Usage:
+    python benchmark.py <session_folder> [<session_folder> ...] [--runs N]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+
+import logic
+from utils.config import config_store
+from utils.constants import RECORD_SESSIONS_KEY, EXPORT_TIMINGS_KEY
+from utils.element_cache import element_cache
+from utils.frame import Frame
+from utils.helpers import set_window_backend, StubWindowBackend
+from utils.ocr import ocr_result_cache
+from utils.price_store import PriceStore, set_price_store
+from utils.replay import Session, replay_session
+from utils.templates import template_store
+from utils.timing import percentile, timings
+
+TIMED_FUNCTIONS = [
+    'take_screenshot',
+    'get_element_coordinates',
+    'locate_element',
+    'extract_text',
+    'extract_texts',
+    'detect_quantity',
+    'detect_prices',
+    'sell_item',
+    'run_sell_flow',
+]
+
+# Replays must neither record new sessions nor export timings, whatever the live config.json says
+PINNED_CONFIG = {
+    RECORD_SESSIONS_KEY: False,
+    EXPORT_TIMINGS_KEY: False,
+}
+
+PROCESS_HANDLERS = {
+    'single': 'handle_sell',
+    'all': 'handle_sell_all',
+}
+
+
+class FunctionTimer:
+    """Wraps functions of the logic module to record the duration of each of their calls."""
+
+    def __init__(self, names):
+        self.names = names
+        self.durations = {name: [] for name in names}
+        self.originals = {}
+
+    def wrap(self, name, function):
+        durations = self.durations[name]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                durations.append(time.perf_counter() - start)
+
+        return timed
+
+    def __enter__(self):
+        for name in self.names:
+            self.originals[name] = getattr(logic, name)
+            setattr(logic, name, self.wrap(name, self.originals[name]))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for name, function in self.originals.items():
+            setattr(logic, name, function)
+        return False
+
+
+def reset_state():
+    # Starts from cold caches, as after a fresh start with no element cache on disk.
+    logic.reset_element_coordinates()
+    template_store.clear_best_scales()
+    ocr_result_cache.clear()
+    logic.reset_prices()
+    timings.reset()
+
+
+def measure_accuracy(session):
+    """
+    Runs detection again on every frame that has recorded detections.
+
+    Returns:
+    dict: The number of correct and total detections, per detection name.
+    """
+    results = {}
+    previous_window = set_window_backend(StubWindowBackend(session.window_size, client_rect=session.client_rect))
+    try:
+        for detection in session.detections:
+            if detection['frame'] < 0:
+                continue
+            frame = Frame(cv2.imread(session.frame_path(detection['frame'])))
+            if detection['name'] == 'quantity':
+                value = logic.detect_quantity(frame)
+            elif detection['name'] == 'prices':
+                # Failed rows would be captured again from the live screen
+                price_map = logic.detect_prices(frame, retry=False)
+                value = [list(item) for item in sorted(price_map.items())] if price_map is not None else None
+            else:
+                continue
+
+            correct, total = results.get(detection['name'], (0, 0))
+            results[detection['name']] = (correct + (value == detection['value']), total + 1)
+    finally:
+        set_window_backend(previous_window)
+    return results
+
+
+def benchmark_session(session, runs):
+    handler = getattr(logic, PROCESS_HANDLERS[session.process_type])
+    recorded_actions = [(action['name'], action['args']) for action in session.actions]
+
+    def run():
+        handler()
+        # Background price checks capture through the replay backends, and are part of the run
+        logic.wait_for_price_checks()
+
+    reset_state()
+    matching_runs = 0
+    durations = []
+    with FunctionTimer(TIMED_FUNCTIONS) as timer:
+        for _ in range(runs):
+            # Prices read in a run would be reused by the next ones, skipping the price table
+            logic.reset_prices()
+            start = time.perf_counter()
+            actions = replay_session(session, run)
+            durations.append(time.perf_counter() - start)
+            matching_runs += [(action['name'], action['args']) for action in actions] == recorded_actions
+
+    return {
+        'frames': len(session.frames),
+        'runs': runs,
+        'process_seconds': durations,
+        'matching_action_runs': matching_runs,
+        'functions': timer.durations,
+        'stages': timings.summary(),
+        'accuracy': measure_accuracy(session),
+    }
+
+
+def print_report(folder, report):
+    print(f"\n{folder}: {report['frames']} frames, {report['runs']} runs, "
+          f"{report['matching_action_runs']}/{report['runs']} runs sent the recorded actions")
+    print(f"  whole process: first run {report['process_seconds'][0] * 1000:.1f} ms, "
+          f"p50 {percentile(report['process_seconds'], 50) * 1000:.1f} ms")
+    print(f"  {'function':<26}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, values in report['functions'].items():
+        if values:
+            print(f"  {name:<26}{len(values):>7}{percentile(values, 50) * 1000:>10.2f}"
+                  f"{percentile(values, 95) * 1000:>10.2f}{percentile(values, 99) * 1000:>10.2f}"
+                  f"{max(values) * 1000:>10.2f}")
+    print(f"  {'stage':<26}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, values in sorted(report['stages'].items()):
+        print(f"  {name:<26}{values['count']:>7}{values['p50_ms']:>10.2f}{values['p95_ms']:>10.2f}"
+              f"{values['p99_ms']:>10.2f}{values['max_ms']:>10.2f}")
+    for name, (correct, total) in report['accuracy'].items():
+        print(f"  {name} accuracy: {correct}/{total} ({correct / total:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sell sessions and report latency and accuracy.")
+    parser.add_argument('sessions', nargs='+', help="Folders of sessions recorded with RECORD_SESSIONS.")
+    parser.add_argument('--runs', type=int, default=5, help="Number of replays of each session.")
+    parser.add_argument('--json', help="Also write the raw results to this file.")
+    args = parser.parse_args()
+
+    # Never touch the element cache and the prices of the live setup
+    element_cache.path = os.path.join(tempfile.mkdtemp(), 'element_cache.json')
+    set_price_store(PriceStore(':memory:'))
+    config_store.pinned.update(PINNED_CONFIG)
+
+    reports = {}
+    for folder in args.sessions:
+        reports[folder] = benchmark_session(Session(folder), args.runs)
+        print_report(folder, reports[folder])
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(reports, json_file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,46 @@
+import threading
+import time
 import tkinter as tk
+import traceback
 import uuid
 
-from logic import update_keybinds, KEYBINDS_FUNCTIONS, reset_element_coordinates
 from utils.config import save_config_key, load_config, get_value
-from utils.constants import DEBUG_MODE_TOGGLE_KEY
+from utils.constants import DEBUG_MODE_TOGGLE_KEY, RES_PATH, DEBUG_PATH, TIMINGS_PATH, TIMING_GUI_REFRESH_MS, \
+    LAYOUT_FOCUS_POLL_MS, KEYBIND_ACTIONS, WARM_UP_POLL_MS
 from utils.data_classes import MessageType
 from utils.debug_utils import debug_print
 from utils.debug_utils import set_debug_mode
+from utils.timing import timings, since_start
+
+# The sell logic imports OpenCV, NumPy and the OCR engine: it is loaded in the background once the GUI is shown
+logic_loaded = threading.Event()
+warm_up_done = threading.Event()
+# Set, along with logic_load_error, if the sell logic could not be loaded
+logic_load_failed = threading.Event()
+logic_load_error = None
+
+SUMMARY_STAGES = ['process', 'first_action', 'capture', 'window', 'element_hit', 'element_miss', 'ocr', 'parse',
+                  'input', 'wait_change', 'wait_cue']
+
+
+def warm_up():
+    global logic_load_error
+    started = time.perf_counter()
+    try:
+        import logic
+    except Exception as error:
+        # Under pythonw, the GUI is the only place the error can be seen
+        debug_print(traceback.format_exc())
+        logic_load_error = repr(error)
+        logic_load_failed.set()
+        return
+    timings.record('startup_import', time.perf_counter() - started)
+    debug_print(f"Sell logic loaded in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    logic_loaded.set()
+
+    logic.warm_up()
+    debug_print(f"Warm-up done {since_start():.1f} s after start.")
+    warm_up_done.set()
 
 
 def start_gui():
@@ -15,6 +49,8 @@ def start_gui():
         root.destroy()
 
     def update_keybinds_wrapper(initial_setup=False):
+        from logic import update_keybinds, KEYBINDS_FUNCTIONS
+
         hotkeys_map = []
         changes_detected = False
 
@@ -35,7 +71,8 @@ def start_gui():
         else:
             send_info_message("Invalid Input: Please enter valid keybinds.", MessageType.WARNING)
 
-    def send_info_message(message, message_type):
+    def send_info_message(message, message_type, duration_ms=2000):
+        # The message is cleared after duration_ms, or kept if it is None
         colors = {
             MessageType.SUCCESS: "green",
             MessageType.WARNING: "orange",
@@ -44,7 +81,8 @@ def start_gui():
         message_id = str(uuid.uuid4())
         current_message.set(message_id)
         info_message.config(text=message, fg=colors.get(message_type, "black"))
-        root.after(2000, clear_info_message, message_id)
+        if duration_ms is not None:
+            root.after(duration_ms, clear_info_message, message_id)
 
     def clear_info_message(message_id):
         if current_message.get() == message_id:
@@ -55,27 +93,73 @@ def start_gui():
         save_config_key(DEBUG_MODE_TOGGLE_KEY, debug_var.get())
 
     def reset_coordinates():
+        from logic import reset_element_coordinates
         reset_element_coordinates()
         send_info_message("Element coordinates reset.", MessageType.SUCCESS)
 
+    def refresh_timings_summary():
+        summary = timings.summary()
+        lines = [f"{'stage':<13}{'p50 ms':>8}{'p95 ms':>8}"]
+        for stage in SUMMARY_STAGES:
+            if stage in summary:
+                lines.append(f"{stage:<13}{summary[stage]['p50_ms']:>8.1f}{summary[stage]['p95_ms']:>8.1f}")
+        lines.append(f"{timings.items} items, {timings.items_per_minute():.1f} items/min")
+        timings_summary.config(text="\n".join(lines))
+        root.after(TIMING_GUI_REFRESH_MS, refresh_timings_summary)
+
+    def poll_game_focus():
+        from logic import detect_layout_on_focus
+        detect_layout_on_focus()
+        root.after(LAYOUT_FOCUS_POLL_MS, poll_game_focus)
+
+    def poll_warm_up():
+        # Hotkeys are set as soon as the sell logic is loaded, the rest of the warm-up may still be running
+        if logic_load_failed.is_set():
+            send_info_message(f"Sell logic could not be loaded: {logic_load_error}", MessageType.ERROR,
+                              duration_ms=None)
+            return
+        if not logic_loaded.is_set():
+            root.after(WARM_UP_POLL_MS, poll_warm_up)
+            return
+
+        if not keybinds_set.get():
+            keybinds_set.set(True)
+            update_keybinds_wrapper(initial_setup=True)
+            poll_game_focus()
+
+        if warm_up_done.is_set():
+            send_info_message("Ready.", MessageType.SUCCESS)
+        else:
+            root.after(WARM_UP_POLL_MS, poll_warm_up)
+
+    def export_timings():
+        folder = f'{RES_PATH}{DEBUG_PATH}{TIMINGS_PATH}'
+        try:
+            timings.export(folder)
+        except OSError as error:
+            send_info_message(f"Timings could not be exported: {error}", MessageType.ERROR)
+            return
+        send_info_message(f"Timings exported to {folder}", MessageType.SUCCESS)
+
     config = load_config()
 
     root = tk.Tk()
     root.title("Dofus AutoSeller")
-    root.geometry("300x250")  # Adjusted height to accommodate the new button
+    root.geometry("300x530")  # Adjusted height to accommodate the timings summary
     root.protocol("WM_DELETE_WINDOW", on_exit)
 
     icon_path = r'res/logo/DAS_icon.ico'
     root.iconbitmap(False, icon_path)
 
     current_message = tk.StringVar(value="")
+    keybinds_set = tk.BooleanVar(value=False)
 
     debug_var = tk.BooleanVar(value=config.get(DEBUG_MODE_TOGGLE_KEY, True))
     tk.Checkbutton(root, text="Debug Mode", variable=debug_var, command=toggle_debug_mode).pack(anchor="w")
 
     keybind_entries = {}
 
-    for key in KEYBINDS_FUNCTIONS.keys():
+    for key in KEYBIND_ACTIONS:
         tk.Label(root, text=f"{key.replace('_', ' ').title()}:").pack(anchor="w")
         entry = tk.Entry(root, width=5, justify='center')
         entry.insert(0, config.get(key, ''))
@@ -90,8 +174,17 @@ def start_gui():
     # Add the new Reset button
     tk.Button(root, text="Reset Coordinates", command=reset_coordinates).pack(anchor="w", pady=10)
 
-    # Call wrapper to set initial keybindings
-    update_keybinds_wrapper(initial_setup=True)
+    timings_summary = tk.Label(root, font=("Courier", 8), justify="left", text="")
+    timings_summary.pack(anchor="w")
+    tk.Button(root, text="Export Timings", command=export_timings).pack(anchor="w", pady=5)
+
     set_debug_mode(debug_var.get())
+    refresh_timings_summary()
+
+    # Initial keybindings are set once the sell logic is loaded
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    send_info_message("Loading...", MessageType.WARNING)
+    poll_warm_up()
+    root.after_idle(lambda: debug_print(f"GUI shown {since_start() * 1000:.0f} ms after start."))
 
     root.mainloop()
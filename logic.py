@@ -1,93 +1,121 @@
+import hashlib
 import os
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
-import keyboard
 import numpy as np
-import pyautogui
-from pytesseract import pytesseract
 
-from utils.config import save_config_key, get_value, load_config
-from utils.constants import WHITE, RES_PATH, DEBUG_PATH, \
-    LOCATE_ELEMENT_THRESHOLD, QUANTITY_ONE, QUANTITY_TEN, QUANTITY_HUNDRED, WHITE_PIXEL_THRESHOLD, \
-    CUSTOM_TESSERACT_CONFIG, DEBUG_MODE_TOGGLE_KEY, SELL_JSON_KEY, \
+from utils.calibration import calibration_profile
+from utils.capture import get_capture
+from utils.config import save_config_key, get_value, load_config, config_store
+from utils.constants import RES_PATH, DEBUG_PATH, \
+    LOCATE_ELEMENT_THRESHOLD, QUANTITY_ONE, QUANTITY_TEN, QUANTITY_HUNDRED, WHITE_PIXEL_THRESHOLD, WHITE, \
+    SELL_JSON_KEY, \
     SELL_ALL_JSON_KEY, ALL_SCREEN_SEARCH_AREA, LOCATE_TITLE_THRESHOLD, DEBUG_SCREEN_WITH_TEMPLATE_PATH, \
-    DEBUG_FOUND_ELEMENTS_PATH
-from utils.data_classes import SellProcessType, Coordinates
+    DEBUG_FOUND_ELEMENTS_PATH, MATCH_ORIGINAL_RESOLUTION, MATCH_START_SCALE_RATIO, MATCH_SCALING_ATTEMPTS, \
+    MATCH_SCALING_INCREMENT, DIGIT_MIN_CONFIDENCE, PRICE_TABLE_ROWS, PRICE_TABLE_ROW_MARGIN, \
+    QUICK_SELL_DELAY, QUICK_SELL_TIMEOUT, PRICE_TYPED_TIMEOUT, CONFIRM_DIALOG_TIMEOUT, CONFIRM_BUTTON_THRESHOLD, \
+    WAIT_POLL_INTERVAL, RECORD_SESSIONS_KEY, SESSIONS_PATH, EXPORT_TIMINGS_KEY, TIMINGS_PATH, \
+    DETECT_LAYOUT_ON_FOCUS_KEY, ALT_SELL_BUTTON_THRESHOLD, ABORT_JSON_KEY, PRICE_FRESHNESS_KEY, ITEM_HASH_SIZE, \
+    QUANTITY_CUES, ALT_QUANTITY_CUES, QUANTITY_CUE_THRESHOLD, MATCH_REFINE_MARGIN
+from utils.data_classes import SellProcessType, SellState, Coordinates
 from utils.debug_utils import debug_print
-from utils.helpers import get_game_window_size, is_game_window_open_and_focused
+from utils.debug_writer import debug_writer
+from utils.digits import get_digit_recognizer
+from utils.element_cache import element_cache
+from utils.frame import Frame, as_frame
+from utils.helpers import get_game_window_size, get_game_client_rect, get_game_window_origin, invalidate_game_window
+from utils.input import get_input
+from utils.matching import find_template, template_size, check_template_at, match_template
+from utils.ocr import get_ocr_engine, binarize, ocr_result_cache
+from utils.price_store import get_price_store
+from utils.replay import record_detection, start_recording, stop_recording
+from utils.state_machine import StateMachine
+from utils.templates import template_store
+from utils.timing import timings, since_start
+from utils.waiter import grab_hash, wait_for_change, wait_for_cue
+from utils.window_context import get_window_context, get_focused_window_context, reset_window_contexts, \
+    abort_window_contexts
+from utils.worker import get_queue_policy
 
 current_keybindings = load_config()
 registered_hotkeys = []
-
-element_coordinates = {}
+first_sell_reported = False
 
 
 def reset_element_coordinates():
-    global element_coordinates
-    element_coordinates = {}
+    reset_window_contexts()
+    element_cache.clear()
     debug_print("Element coordinates have been reset.")
 
 
-def locate_element(template_path, image, threshold=LOCATE_ELEMENT_THRESHOLD, global_search_area=ALL_SCREEN_SEARCH_AREA):
-    if not os.path.exists(template_path):
-        debug_print(f"Template image not found: {template_path}")
-        return None, None
+def get_scaling_factors(window_size):
+    original_width, original_height = MATCH_ORIGINAL_RESOLUTION
+    current_width, current_height = window_size
+
+    scale_factor = min(current_width / original_width, current_height / original_height) * MATCH_START_SCALE_RATIO
+    return [scale_factor * MATCH_SCALING_INCREMENT ** attempt for attempt in range(MATCH_SCALING_ATTEMPTS)]
 
-    template = cv2.imread(template_path)
+
+def locate_element(template_path, image, threshold=LOCATE_ELEMENT_THRESHOLD, global_search_area=ALL_SCREEN_SEARCH_AREA,
+                   bounds=None):
+    # bounds, if given, is the (x, y, w, h) part of the image the search is limited to, e.g. the game client area.
+    # The search runs on the grayscale pyramid of the frame, shared with the other searches on it.
+    template = template_store.get(template_path)
     if template is None:
-        debug_print(f"Failed to load template image: {template_path}")
         return None, None
 
-    template_original_height, template_original_width = template.shape[:2]
-
     current_width, current_height = get_game_window_size()
     if current_width is None or current_height is None:
         return None, None
+    window_size = (current_width, current_height)
 
-    original_width = 2560
-    original_height = 1440
-
-    scale_factor = min(current_width / original_width, current_height / original_height) * 0.9
-    max_scaling_attempts = 10  # Number of attempts to resize the template
-    scaling_increment = 1.02  # Increment scale by 5% each attempt
-
-    image_rgb = image  # Assuming the input 'image' is already in BGR format
-    height, width = image_rgb.shape[:2]
+    frame = as_frame(image)
+    height, width = frame.shape[:2]
     left, top, right, bottom = int(width * global_search_area[0]), int(height * global_search_area[1]), int(
         width * (1 - global_search_area[2])), int(height * (1 - global_search_area[3]))
+    if bounds is not None:
+        left, top = max(left, bounds[0]), max(top, bounds[1])
+        right, bottom = min(right, bounds[0] + bounds[2]), min(bottom, bounds[1] + bounds[3])
 
-    search_area = image_rgb[top:bottom, left:right]
+    search_area = frame.gray[top:bottom, left:right]
 
-    for attempt in range(max_scaling_attempts):
-        new_width = int(template_original_width * scale_factor)
-        new_height = int(template_original_height * scale_factor)
-        template_resized = cv2.resize(template, (new_width, new_height), fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    def coarse_area(levels):
+        return frame.pyramid_level(levels)[top >> levels:bottom >> levels, left >> levels:right >> levels]
 
-        if get_value(DEBUG_MODE_TOGGLE_KEY):
-            debug_screenshot_with_template(search_area, template_resized)
+    scaling_factors = get_scaling_factors(window_size)
+    best_scale = template_store.get_best_scale(template_path, window_size)
+    if best_scale is None:
+        best_scale = calibration_profile.get_scale(template_path, window_size)
 
-        if search_area.shape[0] < template_resized.shape[0] or search_area.shape[1] < template_resized.shape[1]:
-            debug_print(
-                f"Template image is larger than the search area. Template size: {template_resized.shape}, Search area size: {search_area.shape}")
-            return None, None
+    match = None
+    if best_scale is not None:
+        # Try the scale that matched last time, or the calibrated one, before searching all of them
+        match = find_template(search_area, template_path, [best_scale], window_size, threshold,
+                              coarse_area=coarse_area)
+    if match is None:
+        match = find_template(search_area, template_path, scaling_factors, window_size, threshold,
+                              coarse_area=coarse_area)
 
-        # Perform template matching
-        result = cv2.matchTemplate(search_area, template_resized, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    if config_store.debug_mode:
+        debug_scale = match.scale if match is not None else best_scale or scaling_factors[0]
+        template_resized = template_store.get_scaled(template_path, template_size(template, debug_scale), window_size)
+        if search_area.shape[0] >= template_resized.shape[0] and search_area.shape[1] >= template_resized.shape[1]:
+            debug_screenshot_with_template(frame[top:bottom, left:right], template_resized, failure=match is None)
 
-        if max_val >= threshold:
-            found_x, found_y = max_loc[0] + left, max_loc[1] + top
-            element_width, element_height = template_resized.shape[1], template_resized.shape[0]
+    if match is not None:
+        template_store.set_best_scale(template_path, window_size, match.scale)
 
-            if get_value(DEBUG_MODE_TOGGLE_KEY):
-                save_found_element(image, found_x, found_y, element_width, element_height)
+        found_x, found_y = match.loc[0] + left, match.loc[1] + top
+        element_width, element_height = match.size
 
-            return (found_x, found_y), (element_width, element_height)
+        if config_store.debug_mode:
+            save_found_element(frame, found_x, found_y, element_width, element_height)
 
-        # Increase the scale factor for the next attempt
-        scale_factor *= scaling_increment
+        return (found_x, found_y), (element_width, element_height)
 
     debug_print("Element not found after all scaling attempts.")
     return None, None
@@ -96,13 +124,12 @@ def locate_element(template_path, image, threshold=LOCATE_ELEMENT_THRESHOLD, glo
 def save_found_element(image, x, y, width, height):
     """Save the found element as an image for debugging purposes."""
     found_element = image[y:y + height, x:x + width]
-    debug_path = f'{RES_PATH}{DEBUG_PATH}{DEBUG_FOUND_ELEMENTS_PATH}'
-    os.makedirs(debug_path, exist_ok=True)
-    debug_file_path = os.path.join(debug_path, f'found_element_{int(time.time())}.png')
-    cv2.imwrite(debug_file_path, found_element)
+    debug_file_path = os.path.join(f'{RES_PATH}{DEBUG_PATH}{DEBUG_FOUND_ELEMENTS_PATH}',
+                                   f'found_element_{int(time.time() * 1000)}.png')
+    debug_writer.submit('found_element', debug_file_path, found_element)
 
 
-def debug_screenshot_with_template(screen_image, template_image):
+def debug_screenshot_with_template(screen_image, template_image, failure=False):
     """Save a screenshot with the template pasted in the middle for debugging."""
     screen_height, screen_width = screen_image.shape[:2]
     template_height, template_width = template_image.shape[:2]
@@ -111,37 +138,133 @@ def debug_screenshot_with_template(screen_image, template_image):
     center_x = (screen_width - template_width) // 2
     center_y = (screen_height - template_height) // 2
 
-    # Paste the template onto the screen image
-    screen_image_with_template = screen_image.copy()
-    screen_image_with_template[center_y:center_y + template_height, center_x:center_x + template_width] = template_image
+    def paste_template(screen_image_copy):
+        # Runs in the debug writer thread, on its own copy of the screen image
+        screen_image_copy[center_y:center_y + template_height, center_x:center_x + template_width] = template_image
+        return screen_image_copy
+
+    debug_file_path = os.path.join(f'{RES_PATH}{DEBUG_PATH}{DEBUG_SCREEN_WITH_TEMPLATE_PATH}',
+                                   f'debug_screenshot_with_template_{int(time.time() * 1000)}.png')
+    debug_writer.submit('screenshot_with_template', debug_file_path, screen_image, failure=failure,
+                        compose=paste_template)
+
+
+@timings.timed('capture')
+def take_screenshot(region=None):
+    # Grabs the whole screen, or only the (x, y, w, h) region of it, as a Frame, with the current client in front.
+    return Frame(get_window_context().grab(region))
+
+
+def binarize_roi(roi):
+    gray, thresh = binarize(roi)
+    save_binarized(gray, thresh)
+    return thresh
+
+
+def binarize_frame_region(frame, region):
+    # Binarized regions are kept with the frame, as several readers may read the same one.
+    gray, thresh = frame.binarized(region)
+    save_binarized(gray, thresh)
+    return thresh
+
+
+def save_binarized(gray, thresh):
+    if config_store.debug_mode:
+        debug_writer.submit('gray', f'{RES_PATH}{DEBUG_PATH}gray.png', gray)
+        debug_writer.submit('thresholded', f'{RES_PATH}{DEBUG_PATH}thresholded.png', thresh)
+
+
+def is_accepted_digit_read(text, confidence, parse):
+    # A confident glyph read is only trusted if parse, when given, can make sense of it, e.g. as a table row.
+    if not text or confidence < DIGIT_MIN_CONFIDENCE:
+        debug_print(f"Low confidence digit read ({confidence:.2f}), using OCR.")
+        return False
+    if parse is not None and parse(text) is None:
+        debug_print(f"Digit read {text!r} could not be parsed, using OCR.")
+        return False
+    return True
+
+
+def read_binarized_text(thresh, use_cache=True, parse=None):
+    # Digits are read with the glyph recognizer, OCR is only used when it is not confident enough, or when
+    # parse cannot parse its read. A region identical to one read recently is not read again, unless use_cache
+    # is unset, e.g. for a retry.
+    key = ocr_result_cache.get_key(thresh)
+    text = ocr_result_cache.get(key) if use_cache else None
+    if text is not None:
+        return text
+
+    recognizer = get_digit_recognizer()
+    if recognizer is not None:
+        text, confidence = recognizer.read(thresh)
+        if is_accepted_digit_read(text, confidence, parse):
+            ocr_result_cache.set(key, text)
+            return text
+
+    text = get_ocr_engine().read(thresh)
+    ocr_result_cache.set(key, text)
+    return text
 
-    # Save the debug image
-    debug_path = f'{RES_PATH}{DEBUG_PATH}{DEBUG_SCREEN_WITH_TEMPLATE_PATH}'
-    os.makedirs(debug_path, exist_ok=True)
-    debug_file_path = os.path.join(debug_path, f'debug_screenshot_with_template_{int(time.time())}.png')
-    cv2.imwrite(debug_file_path, screen_image_with_template)
 
+@timings.timed('ocr')
+def extract_text(roi, use_cache=True, parse=None):
+    return read_binarized_text(binarize_roi(roi), use_cache, parse)
 
-def take_screenshot():
-    screenshot = pyautogui.screenshot()
-    return cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
 
+@timings.timed('ocr')
+def extract_frame_text(frame, region, parse=None):
+    return read_binarized_text(binarize_frame_region(frame, region), parse=parse)
 
-def extract_text(roi):
-    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-    # upgrade resolution
-    gray = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
 
-    if get_value(DEBUG_MODE_TOGGLE_KEY):
-        cv2.imwrite(f'{RES_PATH}{DEBUG_PATH}gray.png', gray)
+@timings.timed('ocr')
+def extract_texts(rois, parse=None):
+    return read_binarized_texts([binarize_roi(roi) for roi in rois], parse)
 
-    adjusted_threshold = 125
-    _, thresh = cv2.threshold(gray, adjusted_threshold, WHITE, cv2.THRESH_BINARY_INV)
 
-    if get_value(DEBUG_MODE_TOGGLE_KEY):
-        cv2.imwrite(f'{RES_PATH}{DEBUG_PATH}thresholded.png', thresh)
+@timings.timed('ocr')
+def extract_frame_texts(frame, regions, parse=None):
+    return read_binarized_texts([binarize_frame_region(frame, region) for region in regions], parse)
 
-    return pytesseract.image_to_string(thresh, config=CUSTOM_TESSERACT_CONFIG)
+
+def read_binarized_texts(threshs, parse=None):
+    # Reads several regions, with a single OCR engine call for those the glyph recognizer is unsure about.
+    keys = [ocr_result_cache.get_key(thresh) for thresh in threshs]
+    texts = [ocr_result_cache.get(key) for key in keys]
+
+    recognizer = get_digit_recognizer()
+    if recognizer is not None:
+        for index, thresh in enumerate(threshs):
+            if texts[index] is not None:
+                continue
+            text, confidence = recognizer.read(thresh)
+            if is_accepted_digit_read(text, confidence, parse):
+                texts[index] = text
+                ocr_result_cache.set(keys[index], text)
+
+    missing = [index for index, text in enumerate(texts) if text is None]
+    if missing:
+        for index, text in zip(missing, get_ocr_engine().read_batch([threshs[index] for index in missing])):
+            texts[index] = text
+            ocr_result_cache.set(keys[index], text)
+
+    return texts
+
+
+@timings.timed('parse')
+def parse_table_row(row):
+    # Returns the (quantity, price) read on a price table row, or None if the row is not a valid one.
+    numbers = re.findall(r'\d+', row)
+    if len(numbers) < 2 or numbers[0] not in {QUANTITY_ONE, QUANTITY_TEN, QUANTITY_HUNDRED}:
+        return None
+    return int(numbers[0]), int(''.join(numbers[1:]))
+
+
+def parse_quantity(text):
+    # Returns the quantity read in a text, or None if it is not a valid one.
+    numbers = re.findall(r'\d+', text)
+    if not numbers or numbers[-1] not in {QUANTITY_ONE, QUANTITY_TEN, QUANTITY_HUNDRED}:
+        return None
+    return int(numbers[-1])
 
 
 def extract_table(roi):
@@ -154,83 +277,220 @@ def extract_table(roi):
         debug_print(row)
 
     for row in rows:
-        numbers = re.findall(r'\d+', row)
-        if numbers and numbers[0] in {QUANTITY_ONE, QUANTITY_TEN, QUANTITY_HUNDRED}:
-            left_value = int(numbers[0])
-            right_value = int(''.join(numbers[1:]))
-            data_map[left_value] = right_value
+        parsed_row = parse_table_row(row)
+        if parsed_row is not None:
+            data_map[parsed_row[0]] = parsed_row[1]
 
     return data_map
 
 
-def detect_prices(screenshot):
+def find_table_rows(strip, max_rows=PRICE_TABLE_ROWS):
+    """
+    Find the text rows of the price table in a single pass over the column strip below its header.
+
+    A row is a band of consecutive pixel lines containing at least one white pixel. Like the table itself,
+    the search is limited to 5 times the distance between the header and the end of the first row.
+
+    Returns:
+    list: The (start, end) pixel lines of each row, relative to the strip, end excluded.
+    """
+    if strip.size == 0:
+        return []
+
+    is_white_row = np.any(strip > WHITE_PIXEL_THRESHOLD, axis=tuple(range(1, strip.ndim)))
+    padded = np.concatenate(([False], is_white_row, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = changes[0::2], changes[1::2]
+    if len(starts) == 0:
+        return []
+
+    max_height = (ends[0] + 1) * 5
+    return [(int(start), int(end)) for start, end in zip(starts, ends) if end + 1 <= max_height][:max_rows]
+
+
+def detect_prices(screenshot, retry=True):
+    # Rows that could not be read are captured and read again if retry is set, which only makes sense on a
+    # screenshot that was just taken.
     price_table_header_cue_path = f'{RES_PATH}price_table_cue.png'
+    frame = as_frame(screenshot)
 
-    price_loc, elem_size = get_element_coordinates('price_table', price_table_header_cue_path, screenshot)
+    price_loc, elem_size = get_element_coordinates('price_table', price_table_header_cue_path, frame)
     if price_loc is None:
         debug_print("Price table not found.")
         return None
 
-    x_top_r, y_top_r = price_loc[0] + elem_size[0], price_loc[1] + elem_size[1]
-    x_bot_l, y_bot_l = price_loc[0], price_loc[1] + elem_size[1]
-
-    height, width, _ = screenshot.shape
+    x_left, x_right = price_loc[0], price_loc[0] + elem_size[0]
+    y_header_bottom = price_loc[1] + elem_size[1]
+
+    height, width, _ = frame.shape
+
+    # The strip starts on the line right under the header
+    strip_top = y_header_bottom + 1
+    rows = find_table_rows(frame[strip_top:height - 1, x_left:x_right])
+    row_regions = []
+    for start, end in rows:
+        top = max(y_header_bottom, strip_top + start - PRICE_TABLE_ROW_MARGIN)
+        bottom = min(height - 1, strip_top + end + PRICE_TABLE_ROW_MARGIN)
+        row_regions.append((x_left, top, x_right - x_left, bottom - top))
+
+    price_map = {}
+    failed_regions = []
+    texts = extract_frame_texts(frame, row_regions, parse_table_row)
+    for region, text in zip(row_regions, texts):
+        debug_print(text.strip())
+        parsed_row = parse_table_row(text)
+        if parsed_row is None:
+            failed_regions.append(region)
+            continue
+        price_map[parsed_row[0]] = parsed_row[1]
+
+    # The table may have been redrawn while it was captured: only the failed rows are read again
+    for region in failed_regions if retry else []:
+        # The same pixels would be read from the cache, with the same result
+        parsed_row = parse_table_row(extract_text(take_screenshot(region=region).image, use_cache=False,
+                                                  parse=parse_table_row))
+        if parsed_row is not None:
+            price_map[parsed_row[0]] = parsed_row[1]
+        else:
+            debug_print(f"Price table row at {region} could not be read.")
 
-    rows_detected = 0
-    max_height = 0
-    last_row_was_white = False
-    while rows_detected < 3 and y_bot_l < height - 1:
-        y_bot_l += 1
-        horizontal_line = screenshot[y_bot_l, x_bot_l:x_top_r]
-        is_white_row = np.any(horizontal_line > WHITE_PIXEL_THRESHOLD)
+    table_bottom = min(height - 1, strip_top + (rows[-1][1] if rows else 0) + 10)
+    get_window_context().price_table_area = Coordinates(x_left, y_header_bottom, x_right - x_left,
+                                                        table_bottom - y_header_bottom)
 
-        if not is_white_row and last_row_was_white:
-            rows_detected += 1
+    if config_store.debug_mode:
+        roi = frame[y_header_bottom:table_bottom, x_left:x_right]
+        debug_writer.submit('roi', f'{RES_PATH}{DEBUG_PATH}roi.png', roi, failure=not price_map)
 
-        last_row_was_white = is_white_row
+    record_detection('prices', sorted(price_map.items()))
 
-        if max_height == 0:
-            if rows_detected == 1:
-                # debug_print("y_bot_l: " + str(y_bot_l))
-                # debug_print("y_top_r: " + str(y_top_r))
-                max_height = (y_bot_l - y_top_r) * 5 + y_top_r
-                # debug_print("max_height: " + str(max_height))
+    debug_print("Price table:")
+    for key, value in price_map.items():
+        debug_print(f"{key}: {value}")
 
-        if max_height != 0 and y_bot_l > max_height:
-            break
+    return price_map
 
-    y_bot_l += 10  # margin
-    y_bot_l = min(y_bot_l, height - 1)
 
-    top_right_coord = (x_top_r, y_top_r)
-    bot_left_coord = (x_bot_l, y_bot_l)
+def item_key(screenshot):
+    """
+    Identify the item being sold from its icon and name, shown above the quantity.
 
-    roi = screenshot[y_top_r:bot_left_coord[1], bot_left_coord[0]:top_right_coord[0]]
+    The region is shrunk and its gray levels quantized before being hashed, so that small rendering
+    differences between two captures rarely change the key. A changed key only costs a table read.
 
-    if get_value(DEBUG_MODE_TOGGLE_KEY):
-        cv2.imwrite(f'{RES_PATH}{DEBUG_PATH}roi.png', roi)
+    Returns:
+    str: The key of the item, or None if the quantity was not located yet.
+    """
+    quantity_area = get_window_context().element_coordinates.get('quantity_title')
+    if quantity_area is None:
+        return None
 
-    price_map = extract_table(roi)
+    w, h = quantity_area.size
+    x, y = max(0, quantity_area.x), max(0, quantity_area.y - 3 * h)
+    region = as_frame(screenshot).gray[y:y + 2 * h, x:x + w]
+    if region.size == 0:
+        return None
 
-    debug_print("Price table:")
-    for key, value in price_map.items():
-        debug_print(f"{key}: {value}")
+    thumbnail = cv2.resize(region, ITEM_HASH_SIZE, interpolation=cv2.INTER_AREA) >> 5
+    return hashlib.md5(thumbnail.tobytes()).hexdigest()
+
+
+def get_price_map(screenshot, quantity=None):
+    """
+    Get the prices of the item being sold, from the price store if they were read recently enough and include
+    the price of quantity, if given, from its price table otherwise.
+
+    Stored prices are checked against the table in the background, at most once per item and freshness
+    period, and replaced if they were outdated.
+    """
+    key = item_key(screenshot)
+    max_age = get_value(PRICE_FRESHNESS_KEY)
+    if key is not None and max_age:
+        price_map = get_price_store().get_fresh(key, max_age)
+        if price_map and quantity is not None and quantity not in price_map:
+            debug_print(f"Stored prices of item {key[:8]} miss quantity {quantity}, reading its price table.")
+        elif price_map:
+            debug_print(f"Using stored prices of item {key[:8]}: {price_map}")
+            if should_check_prices(key, max_age):
+                # Captured frames are reused by later captures, so the check works on its own copy
+                get_price_check_executor().submit(get_window_context().bind(check_stored_prices),
+                                                  Frame(as_frame(screenshot).image.copy()), key, price_map)
+            return price_map
 
+    price_map = detect_prices(screenshot)
+    if key is not None and price_map:
+        get_price_store().record(key, price_map)
     return price_map
 
 
+def should_check_prices(key, max_age):
+    # Returns whether the stored prices of an item have not been checked for max_age seconds, and if so
+    # counts them as checked now.
+    now = time.monotonic()
+    with price_checked_at_lock:
+        if now - price_checked_at.get(key, -max_age) < max_age:
+            return False
+        price_checked_at[key] = now
+        return True
+
+
+def check_stored_prices(screenshot, key, price_map):
+    # The screenshot is no longer the one shown, so failed rows are not captured again
+    with timings.span('price_check'):
+        table_price_map = detect_prices(screenshot, retry=False)
+    if not table_price_map:
+        return
+    if item_key(screenshot) != key:
+        debug_print(f"Checked price table is not the one of item {key[:8]}, its stored prices are kept.")
+        return
+
+    get_price_store().record(key, table_price_map)
+    if table_price_map != price_map:
+        debug_print(f"Stored prices of item {key[:8]} were outdated: {price_map} instead of {table_price_map}")
+
+
+price_check_executor = None
+price_checked_at = {}
+price_checked_at_lock = threading.Lock()
+
+
+def get_price_check_executor():
+    global price_check_executor
+    if price_check_executor is None:
+        price_check_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-check')
+    return price_check_executor
+
+
+def wait_for_price_checks():
+    # Waits for the background price checks, e.g. before the backends they capture with are replaced.
+    global price_check_executor
+    if price_check_executor is not None:
+        price_check_executor.shutdown(wait=True)
+        price_check_executor = None
+
+
+def reset_prices():
+    # Forgets every stored price, and when they were last checked.
+    wait_for_price_checks()
+    get_price_store().clear()
+    with price_checked_at_lock:
+        price_checked_at.clear()
+
+
+def quantity_title_offset(x, y, w, h):
+    return x, y, 2 * w, h
+
+
 def detect_quantity(screenshot):
     quantity_title_cue_path = f'{RES_PATH}quantity_title_cue.png'
-
-    def position_offset(x, y, w, h):
-        return x, y, 2 * w, h
+    frame = as_frame(screenshot)
 
     # Locate the quantity number by applying the offset to the title's position
     quantity_loc, size = get_element_coordinates(
         'quantity_title',
         quantity_title_cue_path,
-        screenshot,
-        offset_function=lambda x, y, w, h: position_offset(x, y, w, h),
+        frame,
+        offset_function=quantity_title_offset,
     )
 
     if quantity_loc is None:
@@ -242,177 +502,373 @@ def detect_quantity(screenshot):
     roi_w, roi_h = size[0], size[1]
 
     # Define the region of interest (ROI) for the quantity number
-    roi = screenshot[roi_y:roi_y + roi_h, roi_x:roi_x + roi_w]
+    roi = frame[roi_y:roi_y + roi_h, roi_x:roi_x + roi_w]
 
-    if get_value(DEBUG_MODE_TOGGLE_KEY):
-        cv2.imwrite(f'{RES_PATH}{DEBUG_PATH}quantity_roi.png', roi)
+    # Matching the quantity cues is much cheaper than OCR, which is only used when none of them matched
+    quantity = match_quantity(frame, (roi_x, roi_y, roi_w, roi_h))
+    if quantity is not None:
+        debug_print(f"Quantity {quantity} matched.")
+        record_detection('quantity', quantity)
+        return quantity
 
     # Extract the text from the ROI
-    extracted_text = extract_text(roi).strip()
-
-    number_str = re.findall(r'\d+', extracted_text).pop() if extracted_text else None
+    extracted_text = extract_frame_text(frame, (roi_x, roi_y, roi_w, roi_h), parse_quantity).strip()
 
     # Check if the extracted text is a valid quantity
-    if number_str in {QUANTITY_ONE, QUANTITY_TEN, QUANTITY_HUNDRED}:
-        quantity = int(extracted_text)
+    quantity = parse_quantity(extracted_text)
+
+    if config_store.debug_mode:
+        debug_writer.submit('quantity_roi', f'{RES_PATH}{DEBUG_PATH}quantity_roi.png', roi, failure=quantity is None)
+
+    if quantity is not None:
         debug_print(f"Quantity {quantity} detected.")
+        record_detection('quantity', quantity)
         return quantity
 
     debug_print("Quantity not detected.")
+    record_detection('quantity', None)
     return None
 
 
+quantity_cues = None
+
+
+def get_quantity_cues():
+    # Returns the (quantity, cue_path) of the quantity cues of the res folder, normal and prefilled ones.
+    global quantity_cues
+    if quantity_cues is None:
+        quantity_cues = [(quantity, cue_path) for cues in (QUANTITY_CUES, ALT_QUANTITY_CUES)
+                         for quantity, cue_path in cues.items() if os.path.exists(cue_path)]
+        if not quantity_cues:
+            debug_print("No quantity cue found in the res folder, quantities are read with OCR.")
+    return quantity_cues
+
+
+def match_quantity(frame, region):
+    """
+    Read the quantity by matching the quantity cues in its (x, y, w, h) region, at the scale the quantity
+    title was found at.
+
+    Returns:
+    int: The quantity shown, or None if no cue matched, or if the cues are missing from the res folder.
+    """
+    cues = get_quantity_cues()
+    if not cues:
+        return None
+
+    window_size = get_game_window_size()
+    cached = element_cache.get('quantity_title', window_size)
+    if cached is None:
+        return None
+    cached_cue_path, (_, _, cached_width, _) = cached
+    scale = cached_width / template_store.get(cached_cue_path).shape[1]
+
+    x, y, w, h = region
+    area = frame.gray[max(0, y - MATCH_REFINE_MARGIN):y + h + MATCH_REFINE_MARGIN,
+                      max(0, x - MATCH_REFINE_MARGIN):x + w + MATCH_REFINE_MARGIN]
+    matched = set()
+    with timings.span('quantity_match'):
+        for quantity, cue_path in cues:
+            template = template_store.get_gray(cue_path)
+            if template is None:
+                continue
+            size = template_size(template, scale)
+            score, loc = match_template(area, template_store.get_scaled(cue_path, size, window_size, gray=True))
+            if loc is not None and score >= calibration_profile.get_threshold(cue_path, window_size,
+                                                                              QUANTITY_CUE_THRESHOLD):
+                matched.add(quantity)
+
+    # "1" is also found in "10" and "100", so the largest quantity matched is the one shown
+    return max(matched) if matched else None
+
+
+def apply_offset(loc, size, offset_function=None):
+    x, y = loc
+    w, h = size
+    if offset_function:
+        x, y, w, h = offset_function(x, y, w, h)
+    return Coordinates(x, y, w, h)
+
+
 def get_element_coordinates(key, cue_path, screenshot, threshold=LOCATE_ELEMENT_THRESHOLD,
                             search_area=ALL_SCREEN_SEARCH_AREA, offset_function=None):
-    if key in element_coordinates:
-        debug_print(f"Using cached coordinates for {key}.")
-        elem = element_coordinates[key]
-        return (elem.x, elem.y), elem.size
-
-    loc, size = locate_element(cue_path, screenshot, threshold, search_area)
-    if loc is not None:
-        x, y = loc
-        if offset_function:
-            x, y, w, h = offset_function(x, y, size[0], size[1])
-            loc = (x, y)
-            size = (w, h)
-        element_coordinates[key] = Coordinates(x, y, size[0], size[1])
-        debug_print(f"Coordinates for {key} found: {element_coordinates[key]}")
-    return loc, size
+    # Timed as element_hit when the cached position could be verified, element_miss otherwise
+    with timings.span('element_miss') as span:
+        window_size = get_game_window_size()
+        if window_size[0] is None:
+            return None, None
+        frame = as_frame(screenshot)
+        threshold = calibration_profile.get_threshold(cue_path, window_size, threshold)
+
+        # Positions are cached relative to the game window, which may have moved, or be one of several clients
+        element_coordinates = get_window_context().element_coordinates
+        origin_x, origin_y = get_game_window_origin()
+        cached = element_cache.get(key, window_size)
+        if cached is not None:
+            cached_cue_path, (x, y, w, h) = cached
+            rect = (x + origin_x, y + origin_y, w, h)
+            # The element is only trusted if it was found with this cue, as the offset function is the one of the
+            # cue, and if the cue is still found at the cached position
+            if cached_cue_path == cue_path and check_template_at(frame.gray, cue_path, rect, window_size, threshold):
+                # Rebuilt from the current origin, along with the derived areas, in case the window has moved
+                element_coordinates[key] = apply_offset(rect[:2], rect[2:], offset_function)
+                debug_print(f"Using cached coordinates for {key}.")
+                span.stage = 'element_hit'
+                elem = element_coordinates[key]
+                return (elem.x, elem.y), elem.size
+
+            debug_print(f"Cached coordinates for {key} could not be verified, searching again.")
+            element_coordinates.pop(key, None)
+
+        loc, size = locate_element(cue_path, frame, threshold, search_area, bounds=get_game_client_rect())
+        if loc is not None:
+            element_cache.set(key, window_size, cue_path, (loc[0] - origin_x, loc[1] - origin_y), size)
+            element_coordinates[key] = apply_offset(loc, size, offset_function)
+            debug_print(f"Coordinates for {key} found: {element_coordinates[key]}")
+            elem = element_coordinates[key]
+            return (elem.x, elem.y), elem.size
+
+        # The window may have been moved or resized since its geometry was read
+        invalidate_game_window()
+        return loc, size
+
+
+def get_sell_panel_region():
+    # Returns the (x, y, w, h) region covering every sell panel element located so far, or None.
+    context = get_window_context()
+    areas = [context.element_coordinates[key] for key in ('quantity_title', 'price_table', 'price_input')
+             if key in context.element_coordinates]
+    areas += [area for area in (context.price_table_area, context.sell_button_area) if area.size != (0, 0)]
+    if not areas:
+        return None
 
+    left = min(area.x for area in areas)
+    top = min(area.y for area in areas)
+    right = max(area.x + area.size[0] for area in areas)
+    bottom = max(area.y + area.size[1] for area in areas)
+    return int(left), int(top), int(right - left), int(bottom - top)
 
-def sell_item(screenshot, current_price, quick_sell=False):
-    if quick_sell:
-        debug_print("Quick sell for price : " + str(current_price))
-        pyautogui.press('enter')
-        time.sleep(0.16)
-        return
 
-    price_input_cue_path = f'{RES_PATH}price_input_cue.png'
+def oui_button_offset(x, y, w, h):
+    get_window_context().oui_button_area = Coordinates(x - 25, y - 25, w + 50, h * 5)
+    return x + w // 2, y + h // 2, w, h
 
-    # Search for the price input location once and store it
-    price_input_loc, size = get_element_coordinates('price_input', price_input_cue_path, screenshot)
 
-    if price_input_loc is None:
-        debug_print("Price input field not found.")
-        return
+def sell_button_offset(x, y, w, h):
+    get_window_context().sell_button_area = Coordinates(x - 50, y - 50, w + 100, h + 100)
+    return x + (2 * w) / 3, y + h // 2, w, h
 
-    if current_price is None or current_price <= 0:
-        debug_print("Invalid price detected. Operation aborted.")
-        return
 
-    click_x = price_input_loc[0] + size[0] + 50
-    click_y = price_input_loc[1] + size[1] // 2
+def alt_sell_button_offset(x, y, w, h):
+    get_window_context().sell_button_area = Coordinates(x - w - 50, y - 50, w * 4 + 100, h + 100)
+    return x + w // 2, y + h // 2, w, h
 
-    price_value = current_price - 1
-    price = str(price_value)
 
-    pyautogui.click(click_x, click_y)
-    pyautogui.hotkey('ctrl', 'a')
-    pyautogui.press('backspace')
-    pyautogui.typewrite(price)
+def wait_for_oui_button():
+    # Waits for the confirm dialog and returns where to click its button, or None if it did not show up in time.
+    oui_button_cue_path = f'{RES_PATH}oui_button_cue.png'
+    deadline = time.perf_counter() + CONFIRM_DIALOG_TIMEOUT
+    context = get_window_context()
 
-    time.sleep(0.01)
+    if 'oui_button' not in context.element_coordinates:
+        # The dialog position is not known yet: look for it on the whole screen until it appears
+        oui_button_loc = None
+        while oui_button_loc is None and time.perf_counter() < deadline:
+            time.sleep(WAIT_POLL_INTERVAL)
+            oui_button_loc, _ = get_element_coordinates('oui_button', oui_button_cue_path, take_screenshot(),
+                                                        offset_function=oui_button_offset,
+                                                        threshold=CONFIRM_BUTTON_THRESHOLD)
+        if oui_button_loc is None:
+            return None
 
-    click_sell(screenshot, price=price)
+    window_size = get_game_window_size()
+    cached = element_cache.get('oui_button', window_size)
+    if cached is None:
+        return None
+    _, (_, _, width, height) = cached
 
+    # Only the button area is captured until the button is fully displayed
+    oui_button_check_loc = wait_for_cue(oui_button_cue_path, context.oui_button_area.to_region(), (width, height),
+                                        window_size, max(0.0, deadline - time.perf_counter()),
+                                        CONFIRM_BUTTON_THRESHOLD)
+    if oui_button_check_loc is None:
+        return None
 
-sell_button_area = Coordinates(0, 0, 0, 0)
-oui_button_area = Coordinates(0, 0, 0, 0)
+    return oui_button_check_loc[0] + width // 2, oui_button_check_loc[1] + height // 2
 
 
-def click_sell(screenshot, price='0'):
-    def position_offset(x, y, w, h):
-        global sell_button_area
-        sell_button_area = Coordinates(x - 50, y - 50, w + 100, h + 100)
-        return x + (2 * w) / 3, y + h // 2, w, h
+# The sell button cues, with their thresholds: the second one is displayed when the item is already listed
+SELL_BUTTON_CUES = [
+    (f'{RES_PATH}sell_button_cue.png', LOCATE_TITLE_THRESHOLD),
+    (f'{RES_PATH}sell_button_cue_alt.png', ALT_SELL_BUTTON_THRESHOLD),
+]
 
-    def alt_position_offset(x, y, w, h):
-        global sell_button_area
-        sell_button_area = Coordinates(x - w - 50, y - 50, w * 4 + 100, h + 100)
-        return x + w // 2, y + h // 2, w, h
 
-    def oui_button_offset(x, y, w, h):
-        global oui_button_area
-        oui_button_area = Coordinates(x - 25, y - 25, w + 50, h * 5)
-        return x + w // 2, y + h // 2, w, h
+def find_sell_button(region):
+    """
+    Check which of the two sell buttons is displayed in the (x, y, w, h) screen region, capturing only that region.
 
-    sell_button_cue_path = f'{RES_PATH}sell_button_cue.png'
-    sell_button_loc, size = get_element_coordinates('sell_button'
-                                                    , sell_button_cue_path, screenshot
-                                                    , offset_function=position_offset)
+    Both cues are only matched at the size the sell button was located at, rather than searched over every scale.
 
-    if sell_button_loc is None:
-        sell_button_loc, size = get_element_coordinates('sell_button'
-                                                        , f'{RES_PATH}sell_button_cue_alt.png', screenshot
-                                                        , offset_function=alt_position_offset)
-        if sell_button_loc is None:
-            debug_print("Sell button not found.")
-            return
+    Returns:
+    tuple: The cue path of the displayed button and its (x, y, w, h) screen rect, or None if neither is displayed.
+    """
+    window_size = get_game_window_size()
+    cached = element_cache.get('sell_button', window_size)
+    if cached is None:
+        return None
+    cached_cue_path, (_, _, cached_width, _) = cached
+    scale = cached_width / template_store.get(cached_cue_path).shape[1]
+
+    region_image = take_screenshot(region=region).gray
+    for cue_path, threshold in SELL_BUTTON_CUES:
+        template = template_store.get(cue_path)
+        if template is None:
+            continue
+        size = template_size(template, scale)
+        threshold = calibration_profile.get_threshold(cue_path, window_size, threshold)
+        score, loc = match_template(region_image, template_store.get_scaled(cue_path, size, window_size, gray=True))
+        if loc is not None and score >= threshold:
+            return cue_path, (region[0] + loc[0], region[1] + loc[1]) + size
+    return None
 
-    global sell_button_area
-    reduced_screenshot = screenshot[sell_button_area.y:sell_button_area.y + sell_button_area.size[1]
-    , sell_button_area.x:sell_button_area.x + sell_button_area.size[0]]
 
-    check_first_button = locate_element(sell_button_cue_path, reduced_screenshot, LOCATE_TITLE_THRESHOLD)[0]
+def read_quantity_state(flow):
+    flow.data['quantity'] = detect_quantity(flow.data['screenshot'])
+    if flow.data['quantity'] is None:
+        return flow.fail("Quantity not detected.")
+    return SellState.READ_PRICE
 
-    if check_first_button is not None:
-        pyautogui.click(sell_button_loc[0], sell_button_loc[1])
-        debug_print("Item listed at price : " + price)
-        return
 
-    check_alt_button = locate_element(f'{RES_PATH}sell_button_cue_alt.png'
-                                      , reduced_screenshot
-                                      , threshold=0.5)[0]
-
-    if check_alt_button is not None:
-        global oui_button_area
-        pyautogui.press('enter')
-        time.sleep(0.2)
-        oui_screenshot = take_screenshot()
-        tries = 0
-
-        oui_button_cue_path = f'{RES_PATH}oui_button_cue.png'
-        oui_button_loc, size = get_element_coordinates('oui_button'
-                                                       , oui_button_cue_path, oui_screenshot
-                                                       , offset_function=oui_button_offset
-                                                       , threshold=0.85)
-
-        while oui_button_loc is None:
-            if tries > 3:
+def read_price_state(flow):
+    flow.data['price'] = find_current_price(flow.data['screenshot'], flow.data['quantity'])
+    if flow.data['price'] is None:
+        return flow.fail("Price not detected.")
+    return SellState.ENTER_PRICE
+
+
+def enter_price_state(flow):
+    current_price = flow.data['price']
+    if current_price is None or current_price <= 0:
+        return flow.fail("Invalid price detected.")
+
+    price_input_cue_path = f'{RES_PATH}price_input_cue.png'
+
+    # Search for the price input location once and store it
+    price_input_loc, size = get_element_coordinates('price_input', price_input_cue_path, flow.data['screenshot'])
+    if price_input_loc is None:
+        return flow.fail("Price input field not found.")
+
+    click_x = price_input_loc[0] + size[0] + 50
+    click_y = price_input_loc[1] + size[1] // 2
+    flow.data['listed_price'] = str(current_price - 1)
+
+    price_field_region = (price_input_loc[0] + size[0], price_input_loc[1], 100, size[1])
+    reference = grab_hash(price_field_region)
+
+    get_window_context().input.send([
+        ('click', click_x, click_y),
+        ('hotkey', 'ctrl', 'a'),
+        ('press', 'backspace'),
+        ('typewrite', flow.data['listed_price']),
+    ])
+
+    # Wait for the typed price to be displayed before confirming
+    wait_for_change(price_field_region, PRICE_TYPED_TIMEOUT, reference)
+    return SellState.CONFIRM_SELL
+
+
+def confirm_sell_state(flow):
+    # The sell button is located once, after which only its area is captured to tell which button is displayed.
+    # Both buttons are told apart inside that area, so switching from one to the other does not need a new search.
+    context = get_window_context()
+    sell_button = None
+    if context.sell_button_area.size != (0, 0):
+        sell_button = find_sell_button(context.sell_button_area.to_region())
+
+    if sell_button is None:
+        sell_button_loc = None
+        for cue_path, offset_function in get_layout_cues('sell_button'):
+            sell_button_loc, _ = get_element_coordinates('sell_button', cue_path, flow.data['screenshot'],
+                                                         offset_function=offset_function)
+            if sell_button_loc is not None:
                 break
-            time.sleep(0.01)
-            oui_screenshot = take_screenshot()
-            tries += 1
-            oui_button_loc, size = get_element_coordinates('oui_button'
-                                                           , oui_button_cue_path, oui_screenshot
-                                                           , offset_function=oui_button_offset
-                                                           , threshold=0.85)
-
-        if oui_button_loc is not None:
-            time.sleep(0.1)
-            oui_button_reduced_screenshot = oui_screenshot[oui_button_area.y:oui_button_area.y + oui_button_area.size[1]
-            , oui_button_area.x:oui_button_area.x + oui_button_area.size[0]]
-            oui_button_check_loc, oui_button_check_size = locate_element(f'{RES_PATH}oui_button_cue.png'
-                                                                         , oui_button_reduced_screenshot)
-            tries = 0
-            while oui_button_check_loc is None:
-                if tries > 3:
-                    break
-                tries += 1
-                oui_button_reduced_screenshot = take_screenshot()[
-                                                oui_button_area.y:oui_button_area.y + oui_button_area.size[1]
-                , oui_button_area.x:oui_button_area.x + oui_button_area.size[0]]
-                oui_button_check_loc, oui_button_check_size = locate_element(f'{RES_PATH}oui_button_cue.png'
-                                                                             , oui_button_reduced_screenshot)
-
-            if oui_button_check_loc is not None:
-                pyautogui.click(oui_button_check_loc[0] + oui_button_check_size[0] // 2 + oui_button_area.x,
-                                oui_button_check_loc[1] + oui_button_check_size[1] // 2 + oui_button_area.y)
-                debug_print("Item price modified to adjusted price: " + price)
-                return
-
-        debug_print("Confirm sell button not found.")
+        if sell_button_loc is None:
+            return flow.fail("Sell button not found.")
+
+        sell_button = find_sell_button(context.sell_button_area.to_region())
+        if sell_button is None:
+            return flow.fail("Neither sell button is displayed.")
+
+    cue_path, (x, y, w, h) = sell_button
+    if cue_path == SELL_BUTTON_CUES[0][0]:
+        get_window_context().input.click(x + (2 * w) / 3, y + h // 2)
+        record_item_sold()
+        debug_print("Item listed at price : " + flow.data['listed_price'])
+        return SellState.DONE
+
+    # The item is already listed: its price is modified, which has to be confirmed in a dialog
+    get_window_context().input.press('enter')
+    return SellState.CONFIRM_MODIFY
+
+
+def confirm_modify_state(flow):
+    oui_button_click = wait_for_oui_button()
+    if oui_button_click is None:
+        return flow.fail("Confirm sell button not found.")
+
+    get_window_context().input.click(oui_button_click[0], oui_button_click[1])
+    record_item_sold()
+    debug_print("Item price modified to adjusted price: " + flow.data['listed_price'])
+    return SellState.DONE
+
+
+def quick_sell_state(flow):
+    debug_print("Quick sell for price : " + str(flow.data['price']))
+    panel_region = get_sell_panel_region()
+    if panel_region is None:
+        get_window_context().input.press('enter')
+        record_item_sold()
+        time.sleep(QUICK_SELL_DELAY)
+        return SellState.DONE
+
+    # Move on as soon as the game has redrawn the panel after the listing
+    reference = grab_hash(panel_region)
+    get_window_context().input.press('enter')
+    record_item_sold()
+    if not wait_for_change(panel_region, QUICK_SELL_TIMEOUT, reference):
+        debug_print("Sell panel did not change after quick sell.")
+    return SellState.DONE
+
+
+SELL_FLOW_STATES = {
+    SellState.READ_QUANTITY: read_quantity_state,
+    SellState.READ_PRICE: read_price_state,
+    SellState.ENTER_PRICE: enter_price_state,
+    SellState.CONFIRM_SELL: confirm_sell_state,
+    SellState.CONFIRM_MODIFY: confirm_modify_state,
+    SellState.QUICK_SELL: quick_sell_state,
+}
+
+
+def run_sell_flow(screenshot, start, quantity=None, price=None):
+    """
+    Run the sell flow from the start state, on a screenshot taken before it.
+
+    Returns:
+    bool: True if the item was listed.
+    """
+    flow = StateMachine('Sell flow', SellState.FAILED,
+                        data={'screenshot': screenshot, 'quantity': quantity, 'price': price},
+                        cancel_event=get_window_context().cancel_event)
+    for state, handler in SELL_FLOW_STATES.items():
+        flow.add_state(state, handler)
+    return flow.run(start) == SellState.DONE
+
+
+def sell_item(screenshot, current_price, quick_sell=False):
+    return run_sell_flow(screenshot, SellState.QUICK_SELL if quick_sell else SellState.ENTER_PRICE,
+                         price=current_price)
 
 
 def find_current_price(screenshot, quantity):
@@ -420,7 +876,7 @@ def find_current_price(screenshot, quantity):
         debug_print("Invalid quantity detected.")
         return None
 
-    price_map = detect_prices(screenshot)
+    price_map = get_price_map(screenshot, quantity)
     if price_map is None:
         debug_print("Price detection failed.")
         return None
@@ -433,6 +889,162 @@ def find_current_price(screenshot, quantity):
     return current_price
 
 
+# Elements of the sell panel, with the cues they can be found with (tried in order) and their offset functions.
+# The confirm dialog only shows up after a click, so it is not part of the layout.
+LAYOUT_ELEMENTS = {
+    'quantity_title': [(f'{RES_PATH}quantity_title_cue.png', quantity_title_offset)],
+    'price_table': [(f'{RES_PATH}price_table_cue.png', None)],
+    'price_input': [(f'{RES_PATH}price_input_cue.png', None)],
+    'sell_button': [(f'{RES_PATH}sell_button_cue.png', sell_button_offset),
+                    (f'{RES_PATH}sell_button_cue_alt.png', alt_sell_button_offset)],
+}
+
+
+def get_layout_cues(key):
+    # Returns the cues of a layout element, the one its cached position was found with first.
+    cached = element_cache.get(key, get_game_window_size())
+    if cached is None:
+        return LAYOUT_ELEMENTS[key]
+    return sorted(LAYOUT_ELEMENTS[key], key=lambda cue: cue[0] != cached[0])
+
+
+last_focused_context = None
+
+
+def detect_layout(screenshot):
+    """
+    Locate every element of the sell panel on one frame, each one on its own thread.
+
+    Matching releases the GIL, so the searches run on several cores. Found elements are stored in the
+    current window context and in the element cache, along with the areas derived by their offset functions.
+
+    Returns:
+    list: The keys of the elements that could not be found.
+    """
+    def detect_element(key):
+        for cue_path, offset_function in get_layout_cues(key):
+            loc, _ = get_element_coordinates(key, cue_path, screenshot, offset_function=offset_function)
+            if loc is not None:
+                return True
+        return False
+
+    with timings.span('layout'):
+        with ThreadPoolExecutor(max_workers=min(len(LAYOUT_ELEMENTS), os.cpu_count() or 1),
+                                thread_name_prefix='layout') as executor:
+            found = dict(zip(LAYOUT_ELEMENTS, executor.map(get_window_context().bind(detect_element),
+                                                           LAYOUT_ELEMENTS)))
+
+    missing = [key for key, is_found in found.items() if not is_found]
+    if missing:
+        debug_print(f"Layout detection could not find: {', '.join(missing)}")
+    else:
+        debug_print("Layout detected.")
+    return missing
+
+
+def detect_layout_in_background(context):
+    # Detects the layout on the worker of the window, unless it is already known for the current window size.
+    # A sell started meanwhile on the same window waits for it rather than searching the same elements.
+    if context.layout_future is not None and not context.layout_future.done():
+        return
+
+    window_size = context.tracker.get_size()
+    if window_size[0] is None or window_size == context.layout_window_size:
+        return
+
+    def run():
+        if not detect_layout(take_screenshot()):
+            context.layout_window_size = window_size
+
+    context.layout_future = context.submit(run)
+
+
+def detect_layout_on_focus():
+    # Meant to be polled: starts a background layout detection whenever a game window gets focus.
+    global last_focused_context
+    context = get_focused_window_context()
+    if context is not None and context is not last_focused_context and get_value(DETECT_LAYOUT_ON_FOCUS_KEY):
+        detect_layout_in_background(context)
+    last_focused_context = context
+
+
+def record_item_sold():
+    timings.record_item()
+    get_window_context().timings.record_item()
+
+
+def run_on_focused_window(handler):
+    """
+    Hotkey callback: queue handler on the worker of the focused game window, following the hotkey queue policy.
+
+    The hotkey listener is never blocked, and sells on several game clients are captured and recognized at
+    the same time, each client having its own worker. The time from the key press to the first input sent
+    is timed as first_action.
+    """
+    pressed_at = time.perf_counter()
+    context = get_focused_window_context()
+    if context is None:
+        debug_print("Dofus window is not focused. Hotkey ignored.")
+        return
+
+    def run():
+        context.pressed_at = pressed_at
+        try:
+            handler()
+        finally:
+            context.pressed_at = None
+
+    context.submit(run, key=handler.__name__, policy=get_queue_policy())
+
+
+def handle_abort():
+    # Runs on the hotkey listener itself, as the workers are busy with what it stops.
+    if abort_window_contexts():
+        debug_print("Abort requested, stopping at the next step.")
+
+
+def warm_up():
+    """
+    Do, in the background, what the first hotkey press would otherwise wait for: loading the cues, starting the
+    capture, input and OCR engines, reading the game window, and a first template match.
+
+    Each step is timed as its own stage. A failed step is reported and the next ones still run.
+    """
+    for stage, step in (('warm_up_templates', template_store.load_all),
+                        ('warm_up_engines', warm_up_engines),
+                        ('warm_up_match', warm_up_match)):
+        try:
+            with timings.span(stage):
+                step()
+        except Exception as error:
+            debug_print(f"{stage} failed: {error!r}")
+
+
+def warm_up_engines():
+    get_capture()
+    get_input()
+    get_digit_recognizer()
+    get_ocr_engine().read(np.full((32, 32), WHITE, dtype=np.uint8))
+
+
+def warm_up_match():
+    window_size = get_game_window_size()
+    if window_size[0] is None:
+        window_size = MATCH_ORIGINAL_RESOLUTION
+    frame = Frame(np.zeros((window_size[1], window_size[0], 3), dtype=np.uint8))
+    find_template(frame.gray, f'{RES_PATH}price_table_cue.png', get_scaling_factors(window_size)[:1], window_size,
+                  LOCATE_ELEMENT_THRESHOLD, coarse_area=frame.pyramid_level)
+
+
+def report_first_sell():
+    global first_sell_reported
+    if first_sell_reported:
+        return
+    first_sell_reported = True
+    timings.record('first_sell', since_start())
+    debug_print(f"First sell done {since_start():.1f} s after start.")
+
+
 def handle_sell():
     execute_sell_process(single_sell_process, SellProcessType.SINGLE)
 
@@ -442,34 +1054,53 @@ def handle_sell_all():
 
 
 def execute_sell_process(process_function, process_type):
-    if not is_game_window_open_and_focused():
+    context = get_window_context()
+    if context.is_aborted():
+        debug_print(f"{process_type.value} sell action aborted before it started.")
+        return
+    if not context.is_open():
         debug_print(f"Dofus window is not focused. Aborting {process_type.value} sell action.")
         return
 
-    debug_print(f"\n________________ Selling item with {process_type.value} key ________________")
+    debug_print(f"\n________________ Selling item with {process_type.value} key on {context.name} ________________")
     debug_print("Key pressed, processing...")
 
-    saved_mouse_pos = pyautogui.position()
-    pyautogui.moveTo(1, 1)
+    recording = get_value(RECORD_SESSIONS_KEY)
+    if recording:
+        session_folder = f'{RES_PATH}{DEBUG_PATH}{SESSIONS_PATH}{time.strftime("%Y%m%d_%H%M%S")}_{process_type.value}'
+        start_recording(session_folder, process_type.value)
 
-    screenshot = take_screenshot()
-    process_function(screenshot)
+    try:
+        with timings.span('process'), context.timings.span('process'):
+            saved_mouse_pos = context.input.position()
+            context.input.move_to((1, 1))
 
-    pyautogui.moveTo(saved_mouse_pos)
+            screenshot = take_screenshot()
+            process_function(screenshot)
+
+            context.input.move_to(saved_mouse_pos)
+    finally:
+        if recording:
+            stop_recording()
+    report_first_sell()
+
+    if get_value(EXPORT_TIMINGS_KEY):
+        json_path, csv_path = timings.export(f'{RES_PATH}{DEBUG_PATH}{TIMINGS_PATH}')
+        debug_print(f"Timings exported to {json_path} and {csv_path}")
+
+    if config_store.debug_mode:
+        debug_print(f"Debug images: {debug_writer.get_stats()}")
+        debug_print(f"OCR cache: {ocr_result_cache.get_stats()}")
+        debug_print(f"{context.name}: {context.timings.items} items, "
+                    f"{context.timings.items_per_minute():.1f} items/min")
 
     debug_print(f"\nPress key to list the item...")
     debug_print("______________________________________________")
 
 
 def single_sell_process(screenshot):
-    quantity = detect_quantity(screenshot)
-    if quantity is not None:
-        current_price = find_current_price(screenshot, quantity)
-        if current_price is not None:
-            sell_item(screenshot, current_price)
-            return
-    debug_print("Operation aborted.")
-    return
+    if not run_sell_flow(screenshot, SellState.READ_QUANTITY):
+        debug_print("Operation aborted.")
 
 
 def sell_all_process(screenshot):
@@ -482,6 +1113,10 @@ def sell_all_process(screenshot):
     last_price = {1: None, 10: None, 100: None}
 
     while quantity is not None:
+        if get_window_context().is_aborted():
+            debug_print("Sell all aborted.")
+            break
+
         if not quantity_has_changed:
             sell_item(screenshot, last_price[quantity], quick_sell=True)
         else:
@@ -507,6 +1142,8 @@ def sell_all_process(screenshot):
 
 
 def update_keybinds(hotkeys_map, initial_setup=False):
+    import keyboard
+
     if not initial_setup:
         for action, key, function in hotkeys_map:
             current_key = get_value(action)
@@ -514,7 +1151,10 @@ def update_keybinds(hotkeys_map, initial_setup=False):
                 keyboard.remove_hotkey(current_key)
 
     for action, key, function in hotkeys_map:
-        keyboard.add_hotkey(key, function)
+        if action in IMMEDIATE_KEYBINDS:
+            keyboard.add_hotkey(key, function)
+        else:
+            keyboard.add_hotkey(key, lambda function=function: run_on_focused_window(function))
         save_config_key(action, key)
 
     debug_print(f"Updated keybinds: {[(action, key) for action, key, _ in hotkeys_map]}")
@@ -523,4 +1163,7 @@ def update_keybinds(hotkeys_map, initial_setup=False):
 KEYBINDS_FUNCTIONS = {
     SELL_JSON_KEY: handle_sell,
     SELL_ALL_JSON_KEY: handle_sell_all,
+    ABORT_JSON_KEY: handle_abort,
 }
+# Keybinds run on the hotkey listener rather than queued on the worker of the focused game window
+IMMEDIATE_KEYBINDS = {ABORT_JSON_KEY}
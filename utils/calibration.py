@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from utils.constants import CALIBRATION_PATH, RES_PATH, MATCH_ORIGINAL_RESOLUTION, CALIBRATION_MIN_SCALE, \
+    CALIBRATION_MAX_SCALE, CALIBRATION_COARSE_STEP, CALIBRATION_FINE_STEP, CALIBRATION_PRESENT_SCORE
+from utils.debug_utils import debug_print
+from utils.matching import template_size
+from utils.replay import SESSION_FILE_NAME
+from utils.templates import template_store
+
+
+class CalibrationProfile:
+    """
+    Scale and threshold of each cue, per game window size, as measured on saved screenshots by
+    `python -m utils.calibration <screenshots_folder>`.
+
+    The scale and threshold of a window size that was not calibrated are taken from the closest calibrated one,
+    the scale being projected to the window size. Entries whose cue file has changed since are ignored, like in
+    the element cache.
+    """
+
+    def __init__(self, path=CALIBRATION_PATH):
+        self.path = path
+        self.entries = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def window_key(window_size):
+        return f"{window_size[0]}x{window_size[1]}"
+
+    def load(self):
+        with self.lock:
+            self.entries = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r') as calibration_file:
+                        self.entries = json.load(calibration_file)
+                    debug_print(f"Calibration profile loaded for {', '.join(self.entries)}.")
+                except (OSError, ValueError):
+                    debug_print(f"Calibration profile {self.path} could not be read, using default scales.")
+            return self.entries
+
+    def save(self):
+        with self.lock:
+            with open(self.path, 'w') as calibration_file:
+                json.dump(self.entries, calibration_file, indent=4)
+
+    def get_entry(self, cue_path, window_key):
+        entry = self.entries.get(window_key, {}).get(cue_path)
+        if entry is None or entry['cue_hash'] != template_store.get_hash(cue_path):
+            return None
+        return entry
+
+    def get_closest_entry(self, cue_path, window_size):
+        """
+        Get the entry of the cue calibrated at the window size closest to this one.
+
+        Returns:
+        tuple: The ratio between this window size and the calibrated one, and the entry, or (None, None) if
+        the cue was never calibrated.
+        """
+        if self.entries is None:
+            self.load()
+
+        entry = self.get_entry(cue_path, self.window_key(window_size))
+        if entry is not None:
+            return 1.0, entry
+
+        closest = (None, None)
+        for window_key in self.entries:
+            entry = self.get_entry(cue_path, window_key)
+            if entry is None:
+                continue
+            width, height = (int(value) for value in window_key.split('x'))
+            ratio = min(window_size[0] / width, window_size[1] / height)
+            if closest[0] is None or abs(1 - ratio) < abs(1 - closest[0]):
+                closest = (ratio, entry)
+        return closest
+
+    def get_scale(self, cue_path, window_size):
+        # Returns the calibrated scale of the cue for this window size, or None if it was never calibrated.
+        # The interface scales with the window, as the default scales assume
+        ratio, entry = self.get_closest_entry(cue_path, window_size)
+        return entry['scale'] * ratio if entry is not None else None
+
+    def get_threshold(self, cue_path, window_size, default):
+        # Scores do not depend on the scale once the cue is matched at the right one
+        _, entry = self.get_closest_entry(cue_path, window_size)
+        return entry['threshold'] if entry is not None and entry['threshold'] is not None else default
+
+    def set(self, cue_path, window_size, scale, threshold, true_min, false_max, samples):
+        with self.lock:
+            if self.entries is None:
+                self.entries = {}
+            self.entries.setdefault(self.window_key(window_size), {})[cue_path] = {
+                'cue_hash': template_store.get_hash(cue_path),
+                'scale': scale,
+                'threshold': threshold,
+                'true_min': true_min,
+                'false_max': false_max,
+                'samples': samples,
+            }
+
+
+calibration_profile = CalibrationProfile()
+
+
+def score_scale(gray, template, scale):
+    # Returns the best score of the template resized by scale, where it was found, and the score map.
+    size = template_size(template, scale)
+    if not 0 < size[0] <= gray.shape[1] or not 0 < size[1] <= gray.shape[0]:
+        return -1.0, None, None
+    result = cv2.matchTemplate(gray, cv2.resize(template, size, interpolation=cv2.INTER_CUBIC), cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return max_val, max_loc, result
+
+
+def measure_cue(gray, template, window_size):
+    """
+    Find the scale the template matches best at in a grayscale screenshot, first in coarse steps then in fine
+    steps around the best coarse one.
+
+    Returns:
+    tuple: The best scale, its score, and the best score elsewhere in the screenshot, i.e. of a false match.
+    """
+    base = min(window_size[0] / MATCH_ORIGINAL_RESOLUTION[0], window_size[1] / MATCH_ORIGINAL_RESOLUTION[1])
+    scales = []
+    scale = base * CALIBRATION_MIN_SCALE
+    while scale <= base * CALIBRATION_MAX_SCALE:
+        scales.append(scale)
+        scale *= CALIBRATION_COARSE_STEP
+
+    best_score, best_scale = max((score_scale(gray, template, scale)[0], scale) for scale in scales)
+    fine_scales = [best_scale * CALIBRATION_FINE_STEP ** step for step in range(-4, 5)]
+    best_score, best_scale = max((score_scale(gray, template, scale)[0], scale) for scale in fine_scales)
+
+    # The best score away from the true match, which a too low threshold would accept
+    _, loc, result = score_scale(gray, template, best_scale)
+    if loc is None:
+        return best_scale, best_score, -1.0
+    width, height = template_size(template, best_scale)
+    masked = result.copy()
+    masked[max(0, loc[1] - height):loc[1] + height, max(0, loc[0] - width):loc[0] + width] = -1.0
+    return best_scale, best_score, float(masked.max())
+
+
+def get_folder_window_size(folder):
+    # Returns the game window size recorded with a session folder, see utils/replay.py, or None.
+    try:
+        with open(os.path.join(folder, SESSION_FILE_NAME), 'r') as session_file:
+            window_size = json.load(session_file).get('window_size')
+    except (OSError, ValueError):
+        return None
+    return tuple(window_size) if window_size else None
+
+
+def calibrate_folder(folder, profile=calibration_profile, window_size=None):
+    """
+    Calibrate every cue of the res folder on the screenshots of a folder, saved with the game in the window
+    size they will be used at.
+
+    Entries are stored under the game window size, as looked up when selling: window_size if given, else the
+    one recorded in the session.json of a recorded session, else the size of each screenshot, as for a game
+    in borderless fullscreen.
+
+    A cue scoring at least CALIBRATION_PRESENT_SCORE on a screenshot is considered shown on it. Its scale is the
+    median of its best scales, and its threshold halfway between its lowest true score and the highest score of
+    a false match: elsewhere on screenshots it is shown on, anywhere on the others.
+    """
+    cue_paths = [f'{RES_PATH}{file_name}' for file_name in sorted(os.listdir(RES_PATH))
+                 if file_name.lower().endswith('.png')]
+
+    folder_window_size = window_size or get_folder_window_size(folder)
+    measures = {}
+    for file_name in sorted(os.listdir(folder)):
+        screenshot = cv2.imread(os.path.join(folder, file_name))
+        if screenshot is None:
+            continue
+        gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        window_size = folder_window_size or (screenshot.shape[1], screenshot.shape[0])
+        for cue_path in cue_paths:
+            template = template_store.get_gray(cue_path)
+            if template is None:
+                continue
+            measures.setdefault((window_size, cue_path), []).append(measure_cue(gray, template, window_size))
+        print(f"{file_name} measured.")
+
+    if not measures:
+        print(f"No screenshot found in {folder}.")
+        return None
+
+    profile.load()
+    for (window_size, cue_path), cue_measures in sorted(measures.items()):
+        true_scores = [score for _, score, _ in cue_measures if score >= CALIBRATION_PRESENT_SCORE]
+        if not true_scores:
+            print(f"{cue_path} at {profile.window_key(window_size)}: never shown, not calibrated.")
+            continue
+
+        scale = float(np.median([scale for scale, score, _ in cue_measures if score >= CALIBRATION_PRESENT_SCORE]))
+        false_scores = [false_score if score >= CALIBRATION_PRESENT_SCORE else score
+                        for _, score, false_score in cue_measures]
+        true_min, false_max = min(true_scores), max(false_scores)
+        threshold = round((true_min + false_max) / 2, 3) if true_min > false_max else None
+        profile.set(cue_path, window_size, scale, threshold, true_min, false_max, len(true_scores))
+        print(f"{cue_path} at {profile.window_key(window_size)}: scale {scale:.3f}, true scores >= {true_min:.3f}, "
+              f"false scores <= {false_max:.3f}, threshold {threshold if threshold is not None else 'unchanged'}")
+
+    profile.save()
+    print(f"Calibration profile saved to {profile.path}.")
+    return profile
+
+
+def parse_window_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibrate the scale and threshold of every cue on screenshots.")
+    parser.add_argument('folder', help="Folder of full screen screenshots, or of a recorded session.")
+    parser.add_argument('--window-size', type=parse_window_size, metavar='WxH',
+                        help="Size of the game window on the screenshots, if it is not recorded with them and "
+                             "the game is not in borderless fullscreen.")
+    args = parser.parse_args()
+    calibrate_folder(args.folder, window_size=args.window_size)
@@ -0,0 +1,206 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from utils.constants import CAPTURE_BUFFER_COUNT
+from utils.debug_utils import debug_print
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+
+class ScreenCapture:
+    """
+    Grabs the screen, or only a region (x, y, w, h) of it in screen coordinates, as a BGR NumPy image.
+
+    Returned frames may be backed by reused buffers: a frame stays valid until CAPTURE_BUFFER_COUNT
+    other frames of the same size have been grabbed. Copy it to keep it longer.
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self.buffers = {}
+        self.buffer_index = {}
+        # Several workers grab at once
+        self.buffers_lock = threading.Lock()
+
+    def grab(self, region=None):
+        raise NotImplementedError
+
+    def get_buffer(self, height, width):
+        # Rotates between a few preallocated buffers for each frame size.
+        shape = (height, width, 3)
+        with self.buffers_lock:
+            buffers = self.buffers.get(shape)
+            if buffers is None:
+                buffers = [np.empty(shape, dtype=np.uint8) for _ in range(CAPTURE_BUFFER_COUNT)]
+                self.buffers[shape] = buffers
+                self.buffer_index[shape] = 0
+
+            index = self.buffer_index[shape]
+            self.buffer_index[shape] = (index + 1) % len(buffers)
+            return buffers[index]
+
+    def close(self):
+        with self.buffers_lock:
+            self.buffers = {}
+            self.buffer_index = {}
+
+
+def clip_region(region, screen_width, screen_height):
+    """Clip a (x, y, w, h) region to the screen, or return the whole screen for None."""
+    if region is None:
+        return 0, 0, screen_width, screen_height
+
+    x, y, w, h = (int(value) for value in region)
+    left, top = max(0, x), max(0, y)
+    right, bottom = min(screen_width, x + w), min(screen_height, y + h)
+    return left, top, max(0, right - left), max(0, bottom - top)
+
+
+class MssCapture(ScreenCapture):
+    """Copies only the requested region of the primary monitor, converting it from BGRA in place."""
+
+    name = 'mss'
+
+    def __init__(self):
+        super().__init__()
+        # mss instances can only be used from the thread that created them
+        self.local = threading.local()
+
+    def get_sct(self):
+        sct = getattr(self.local, 'sct', None)
+        if sct is None:
+            sct = mss.mss()
+            self.local.sct = sct
+        return sct
+
+    def grab(self, region=None):
+        sct = self.get_sct()
+        monitor = sct.monitors[1]
+        x, y, w, h = clip_region(region, monitor['width'], monitor['height'])
+
+        shot = sct.grab({'left': monitor['left'] + x, 'top': monitor['top'] + y, 'width': w, 'height': h})
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self.get_buffer(shot.height, shot.width))
+
+    def close(self):
+        sct = getattr(self.local, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self.local.sct = None
+        super().close()
+
+
+class PyautoguiCapture(ScreenCapture):
+    """Grabs the screen through pyautogui and PIL. Slower, but needs no extra dependency."""
+
+    name = 'pyautogui'
+
+    def grab(self, region=None):
+        import pyautogui
+
+        screen_width, screen_height = pyautogui.size()
+        x, y, w, h = clip_region(region, screen_width, screen_height)
+        screenshot = pyautogui.screenshot(region=(x, y, w, h))
+        return cv2.cvtColor(np.asarray(screenshot), cv2.COLOR_RGB2BGR, dst=self.get_buffer(h, w))
+
+
+class ReplayCapture(ScreenCapture):
+    """
+    Replays screenshots saved on disk instead of grabbing the screen, for headless runs.
+
+    Every full screen grab moves to the next frame, region grabs are cropped from the current one.
+    Once an input has been sent (see on_input), region grabs are cropped from the next frame instead,
+    as the game would have redrawn in response. The last frame is repeated once all of them have been replayed.
+    """
+
+    name = 'replay'
+
+    def __init__(self, frames):
+        super().__init__()
+        self.frames = frames
+        self.frame_index = -1
+        self.input_pending = False
+
+    @classmethod
+    def from_files(cls, paths):
+        return cls([cv2.imread(path) for path in paths])
+
+    @classmethod
+    def from_folder(cls, folder):
+        return cls.from_files([os.path.join(folder, file_name) for file_name in sorted(os.listdir(folder))
+                               if file_name.lower().endswith('.png')])
+
+    def on_input(self, action=None):
+        self.input_pending = True
+
+    def grab(self, region=None):
+        if region is None:
+            self.frame_index = min(self.frame_index + 1, len(self.frames) - 1)
+            self.input_pending = False
+            frame_index = self.frame_index
+        elif self.input_pending:
+            frame_index = min(self.frame_index + 1, len(self.frames) - 1)
+        else:
+            frame_index = max(0, self.frame_index)
+
+        frame = self.frames[frame_index]
+        x, y, w, h = clip_region(region, frame.shape[1], frame.shape[0])
+        return frame[y:y + h, x:x + w]
+
+
+class RecordingCapture(ScreenCapture):
+    """Forwards grabs to another capture backend, and calls listener with every full screen frame."""
+
+    name = 'recording'
+
+    def __init__(self, capture, listener):
+        super().__init__()
+        self.capture = capture
+        self.listener = listener
+        self.name = f'recording ({capture.name})'
+
+    def grab(self, region=None):
+        frame = self.capture.grab(region)
+        if region is None:
+            self.listener(frame)
+        return frame
+
+    def close(self):
+        self.capture.close()
+
+
+def create_capture():
+    if mss is not None:
+        return MssCapture()
+
+    debug_print("mss is not installed, screenshots will be taken through pyautogui.")
+    return PyautoguiCapture()
+
+
+_capture = None
+_capture_lock = threading.Lock()
+
+
+def get_capture():
+    global _capture
+    with _capture_lock:
+        if _capture is None:
+            _capture = create_capture()
+            debug_print(f"Screen capture backend: {_capture.name}")
+        return _capture
+
+
+def set_capture(capture):
+    # Replaces the capture backend, e.g. with a ReplayCapture for headless runs.
+    # Returns the previous backend, which is not closed so it can be set back afterwards.
+    global _capture
+    with _capture_lock:
+        previous, _capture = _capture, capture
+        return previous
@@ -1,39 +1,101 @@
 import json
 import os
+import threading
 
-from utils.constants import CONFIG_PATH, DEFAULT_CONFIG_PATH
+from utils.constants import CONFIG_PATH, DEFAULT_CONFIG_PATH, DEBUG_MODE_TOGGLE_KEY
 from utils.debug_utils import debug_print
 
 
+class ConfigStore:
+    # Keeps the configuration in memory. The file is only read again when its modification time changes,
+    # and every change is written through to it.
+    # Hot paths should read the plain attributes (debug_mode) rather than calling get().
+
+    def __init__(self, path=CONFIG_PATH, default_path=DEFAULT_CONFIG_PATH):
+        self.path = path
+        self.default_path = default_path
+        self.values = None
+        self.default_values = None
+        self.mtime = None
+        self.debug_mode = False
+        # Values used instead of those of the file, without being saved, e.g. for benchmarks
+        self.pinned = {}
+        self.lock = threading.RLock()
+
+    def get_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get_default_values(self):
+        if self.default_values is None:
+            with open(self.default_path, 'r') as default_config_file:
+                self.default_values = json.load(default_config_file)
+        return self.default_values
+
+    def refresh(self):
+        # Reloads the configuration if the file changed since it was last read or written.
+        with self.lock:
+            if self.values is None or self.get_mtime() != self.mtime:
+                self.reload()
+            return self.values
+
+    def reload(self):
+        config = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as config_file:
+                config = json.load(config_file)
+
+        if check_config_integrity(config):
+            self.set_values(config, self.get_mtime())
+        else:
+            self.write(config)
+
+    def set_values(self, config, mtime):
+        self.values = config
+        self.mtime = mtime
+        self.debug_mode = bool(config.get(DEBUG_MODE_TOGGLE_KEY, False))
+
+    def write(self, config):
+        with self.lock:
+            with open(self.path, 'w') as config_file:
+                json.dump(config, config_file, indent=4)
+            self.set_values(dict(config), self.get_mtime())
+            debug_print("Config saved.")
+
+    def get(self, key):
+        if key in self.pinned:
+            return self.pinned[key]
+        return self.refresh().get(key, None)
+
+    def set(self, key, value):
+        with self.lock:
+            config = dict(self.refresh())
+            config[key] = value
+            self.write(config)
+
+
+config_store = ConfigStore()
+
+
 def save_config_key(key, value):
     # Saves a single key-value pair to the configuration file.
-    config = load_config()
-    config[key] = value
-    save_config(config)
+    config_store.set(key, value)
 
 
 def load_config():
-    # Loads the configuration from a file, checks its integrity, and saves it if it's incomplete.
+    # Loads the configuration, checks its integrity, and saves it if it's incomplete.
+    # The file is only read again if it changed since the last call.
     # Returns:
-    # dict: The loaded and possibly updated configuration.
-    config = {}
-    if os.path.exists(CONFIG_PATH):
-        with open(CONFIG_PATH, 'r') as config_file:
-            config = json.load(config_file)
-            if check_config_integrity(config):
-                return config
-
-    load_and_save_default_config()
-
-    return config
+    # dict: A copy of the loaded and possibly updated configuration.
+    return dict(config_store.refresh())
 
 
 def load_and_save_default_config():
     # Loads the default configuration from a file and saves it to the config file.
-    with open(DEFAULT_CONFIG_PATH, 'r') as default_config_file:
-        config = json.load(default_config_file)
-        save_config(config)
-        debug_print("Default config loaded and saved.")
+    config_store.write(dict(config_store.get_default_values()))
+    debug_print("Default config loaded and saved.")
 
 
 def check_config_integrity(config):
@@ -43,8 +105,7 @@ def check_config_integrity(config):
     #
     # Returns:
     # bool: True if the configuration was already complete, False if it was updated.
-    with open(DEFAULT_CONFIG_PATH, 'r') as default_config_file:
-        default_config = json.load(default_config_file)
+    default_config = config_store.get_default_values()
 
     updated = False
     for key in default_config:
@@ -60,11 +121,8 @@ def save_config(config):
     # Saves the configuration to a file.
     # Args:
     # config (dict): The configuration to save.
-    with open(CONFIG_PATH, 'w') as config_file:
-        json.dump(config, config_file, indent=4)
-        debug_print("Config saved.")
+    config_store.write(config)
 
 
 def get_value(key):
-    config = load_config()
-    return config.get(key, None)
+    return config_store.get(key)
@@ -1,32 +1,104 @@
-import pytesseract
-
 TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-CUSTOM_TESSERACT_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789'
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+OCR_LANGUAGE = 'eng'
+OCR_UPSCALE_FACTOR = 2
+OCR_BINARY_THRESHOLD = 125
+OCR_CACHE_SIZE = 256
+OCR_BATCH_SPACING = 20  # Blank pixel lines between the images stacked for a single tesseract process
+OCR_CHAR_WHITELIST = '0123456789'
+CUSTOM_TESSERACT_CONFIG = rf'--oem 3 --psm 6 -c tessedit_char_whitelist={OCR_CHAR_WHITELIST}'
 
 CONFIG_PATH = 'config.json'
 DEFAULT_CONFIG_PATH = 'default_config.json'
+ELEMENT_CACHE_PATH = 'element_cache.json'
+PRICE_STORE_PATH = 'prices.sqlite3'
+CALIBRATION_PATH = 'calibration.json'
 
+CAPTURE_BUFFER_COUNT = 4
+TEMPLATE_WINDOW_SIZES = 4  # Window sizes the scaled templates are kept for, one per game client of a different size
+WARM_UP_POLL_MS = 100  # How often the GUI checks whether the background warm-up is done
+LAYOUT_FOCUS_POLL_MS = 1000  # How often the GUI checks whether the game window got focus
+WINDOW_REFRESH_INTERVAL = 0.5  # How long the game window geometry and focus are cached, in seconds
+FOCUS_SWITCH_TIMEOUT = 0.5  # How long a game client brought to the front may take to be drawn there, in seconds
 WHITE_PIXEL_THRESHOLD = 180
 WHITE = 255
 RES_PATH = 'res/'
 DEBUG_PATH = 'debug/'
 DEBUG_SCREEN_WITH_TEMPLATE_PATH = f'template_matching'
 DEBUG_FOUND_ELEMENTS_PATH = f'found_elements'
+SESSIONS_PATH = 'sessions/'
+TIMINGS_PATH = 'timings/'
+DEBUG_WRITER_QUEUE_SIZE = 32
 LOCATE_ELEMENT_THRESHOLD = 0.7
 LOCATE_TITLE_THRESHOLD = 0.7
+ALT_SELL_BUTTON_THRESHOLD = 0.5
+PRICE_TABLE_ROWS = 3
+PRICE_TABLE_ROW_MARGIN = 3
+WAIT_POLL_INTERVAL = 0.005
+WAIT_HASH_STEP = 2
+QUICK_SELL_DELAY = 0.16  # Fixed wait, only used until the sell panel has been located
+QUICK_SELL_TIMEOUT = 0.5
+PRICE_TYPED_TIMEOUT = 0.1
+CONFIRM_DIALOG_TIMEOUT = 1.0
+CONFIRM_BUTTON_THRESHOLD = 0.85
+QUANTITY_CUE_THRESHOLD = 0.85
+ITEM_HASH_SIZE = (32, 8)  # Size the item icon and name are shrunk to before being hashed
+# Delays in seconds between the actions of an input batch, between typed keys, and after a whole batch
+INPUT_PACING_PROFILES = {
+    'fast': {'action_interval': 0.01, 'key_interval': 0.0, 'pause': 0.0},
+    'safe': {'action_interval': 0.1, 'key_interval': 0.02, 'pause': 0.1},
+}
+DEFAULT_INPUT_PACING = 'fast'
+# What a hotkey press does while its game window is busy: ignore it, ignore it if the same hotkey is already
+# waiting, or make it wait its turn
+HOTKEY_QUEUE_POLICIES = ('drop', 'coalesce', 'queue')
+DEFAULT_HOTKEY_QUEUE_POLICY = 'coalesce'
+HOTKEY_QUEUE_SIZE = 4  # Presses kept waiting per game window with the queue policy
+TIMING_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)  # Upper bounds of the histogram buckets
+TIMING_MAX_SAMPLES = 1000  # Percentiles are computed on the most recent durations of each stage
+TIMING_GUI_REFRESH_MS = 1000
 QUANTITY_ONE = '1'
 QUANTITY_TEN = '10'
 QUANTITY_HUNDRED = '100'
+MATCH_ORIGINAL_RESOLUTION = (2560, 1440)  # Resolution the cues were captured at
+MATCH_START_SCALE_RATIO = 0.9
+MATCH_SCALING_ATTEMPTS = 10
+MATCH_SCALING_INCREMENT = 1.02
+MATCH_PYRAMID_LEVELS = 2  # Each level halves the resolution of the coarse search
+MATCH_MIN_COARSE_TEMPLATE_SIZE = 8  # Below this size (in pixels) the coarse search is skipped
+MATCH_REFINE_CANDIDATES = 3
+MATCH_REFINE_MARGIN = 6
+# Scales searched by the calibration, relative to the default scale of the window size, and their steps
+CALIBRATION_MIN_SCALE = 0.6
+CALIBRATION_MAX_SCALE = 1.4
+CALIBRATION_COARSE_STEP = 1.04
+CALIBRATION_FINE_STEP = 1.01
+CALIBRATION_PRESENT_SCORE = 0.8  # Score from which a cue is considered shown on a calibration screenshot
 ALL_SCREEN_SEARCH_AREA = (0, 0, 0, 0)
 SELL_SEARCH_AREA = (1 / 6.5, 1 / 6, 0.7, 1 / 6)  # (left, top, right, bottom)
 OUI_BUTTON_SEARCH_AREA = (2 / 7, 1 / 2, 3 / 7, 1 / 4)
 INPUTS_SEARCH_AREA = (1 / 6.5, 1/6, 0.7, 1 / 2)
 PRICES_SEARCH_AREA = (1 / 6.5, 0.45, 0.7, 1 / 6)
 
+DIGIT_ATLAS_PATH = f'{RES_PATH}digit_atlas.npz'
+DIGIT_GLYPH_SIZE = (12, 18)  # (width, height) glyphs are normalized to before comparison
+DIGIT_MIN_CONFIDENCE = 0.85
+DIGIT_SPACE_RATIO = 0.6  # A gap wider than this ratio of the glyph height separates two values
+DIGIT_MIN_GLYPH_AREA = 6
+
 DEBUG_MODE_TOGGLE_KEY = 'DEBUG_MODE'
+DEBUG_SAMPLE_EVERY_KEY = 'DEBUG_SAMPLE_EVERY'
+DEBUG_FAILURES_ONLY_KEY = 'DEBUG_FAILURES_ONLY'
+RECORD_SESSIONS_KEY = 'RECORD_SESSIONS'
+EXPORT_TIMINGS_KEY = 'EXPORT_TIMINGS'
+INPUT_PACING_KEY = 'INPUT_PACING'
+DETECT_LAYOUT_ON_FOCUS_KEY = 'DETECT_LAYOUT_ON_FOCUS'
+HOTKEY_QUEUE_POLICY_KEY = 'HOTKEY_QUEUE_POLICY'
+PRICE_FRESHNESS_KEY = 'PRICE_FRESHNESS_SECONDS'
 SELL_JSON_KEY = 'SELL_KEY'
 SELL_ALL_JSON_KEY = 'SELL_ALL_KEY'
+ABORT_JSON_KEY = 'ABORT_KEY'
+# Keybinds shown in the GUI, which has them before the sell logic is loaded
+KEYBIND_ACTIONS = [SELL_JSON_KEY, SELL_ALL_JSON_KEY, ABORT_JSON_KEY]
 
 QUANTITY_CUES = {
     1: f'{RES_PATH}quantity_1_cue.png',
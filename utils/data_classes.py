@@ -12,12 +12,28 @@ class SellProcessType(Enum):
     ALL = "all"
 
 
+class SellState(Enum):
+    READ_QUANTITY = "read_quantity"
+    READ_PRICE = "read_price"
+    ENTER_PRICE = "enter_price"
+    CONFIRM_SELL = "confirm_sell"
+    CONFIRM_MODIFY = "confirm_modify"
+    QUICK_SELL = "quick_sell"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class Coordinates:
     def __init__(self, x, y, w, h):
         self.x = x
         self.y = y
         self.size = (w, h)
 
+    def to_region(self):
+        # Returns the (x, y, w, h) screen region covered by these coordinates, cut at the top left screen edges.
+        x, y = max(0, self.x), max(0, self.y)
+        return int(x), int(y), int(self.size[0] - (x - self.x)), int(self.size[1] - (y - self.y))
+
     def __str__(self):
         return f"Coordinates(x={self.x}, y={self.y}, size={self.size})"
 
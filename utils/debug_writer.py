@@ -0,0 +1,93 @@
+import os
+import queue
+import threading
+
+import cv2
+
+from utils.config import config_store
+from utils.constants import DEBUG_WRITER_QUEUE_SIZE, DEBUG_SAMPLE_EVERY_KEY, DEBUG_FAILURES_ONLY_KEY
+from utils.debug_utils import debug_print
+
+
+class DebugWriter:
+    """
+    Encodes and writes debug images on a background thread, so debug mode does not slow down the sell process.
+
+    Images are sampled per category (only every Nth image, or only failures, as configured) and dropped
+    when the queue is full rather than blocking the caller.
+    """
+
+    def __init__(self, queue_size=DEBUG_WRITER_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.category_counts = {}
+        self.stats = {'submitted': 0, 'sampled_out': 0, 'dropped': 0, 'written': 0, 'failed': 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='debug-writer', daemon=True)
+                self.thread.start()
+
+    def should_write(self, category, failure):
+        sample_every = max(1, int(config_store.get(DEBUG_SAMPLE_EVERY_KEY) or 1))
+        failures_only = bool(config_store.get(DEBUG_FAILURES_ONLY_KEY))
+
+        if failures_only and not failure:
+            return False
+
+        with self.lock:
+            count = self.category_counts.get(category, 0)
+            self.category_counts[category] = count + 1
+        return count % sample_every == 0
+
+    def submit(self, category, path, image, failure=False, compose=None):
+        """
+        Queue an image to be written to path.
+
+        The image is copied, as it may be a reused capture buffer. compose, if given, is called on the copy
+        in the writer thread and must return the image to write.
+        """
+        self.stats['submitted'] += 1
+        if not self.should_write(category, failure):
+            self.stats['sampled_out'] += 1
+            return False
+
+        self.start()
+        try:
+            self.queue.put_nowait((path, image.copy(), compose))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        return True
+
+    def run(self):
+        while True:
+            path, image, compose = self.queue.get()
+            try:
+                if compose is not None:
+                    image = compose(image)
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if cv2.imwrite(path, image):
+                    self.stats['written'] += 1
+                else:
+                    self.stats['failed'] += 1
+            except (OSError, cv2.error) as error:
+                self.stats['failed'] += 1
+                debug_print(f"Debug image {path} could not be written: {error}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # Blocks until every queued image has been written.
+        if self.thread is not None:
+            self.queue.join()
+
+    def get_stats(self):
+        return dict(self.stats, queued=self.queue.qsize())
+
+
+debug_writer = DebugWriter()
@@ -0,0 +1,213 @@
+import os
+import re
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+from utils.constants import DIGIT_ATLAS_PATH, DIGIT_GLYPH_SIZE, DIGIT_SPACE_RATIO, DIGIT_MIN_GLYPH_AREA
+from utils.debug_utils import debug_print
+from utils.ocr import binarize
+
+
+def segment_glyphs(thresh):
+    """
+    Split a thresholded image (dark text on white) into its connected glyphs.
+
+    Returns:
+    list: One list of glyph bounding boxes (x, y, w, h) per text line, lines from top to bottom and
+    glyphs from left to right.
+    """
+    ink = (thresh < 128).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+
+    # Label 0 is the background
+    boxes = stats[1:count, :4]
+    areas = stats[1:count, cv2.CC_STAT_AREA]
+    boxes = boxes[areas >= DIGIT_MIN_GLYPH_AREA]
+    if len(boxes) == 0:
+        return []
+
+    # Table borders and noise are much shorter or taller than the digits
+    glyph_height = np.median(boxes[:, 3])
+    heights = boxes[:, 3]
+    boxes = boxes[(heights >= glyph_height * 0.5) & (heights <= glyph_height * 1.5)]
+
+    centers = boxes[:, 1] + boxes[:, 3] / 2
+    boxes = boxes[np.argsort(centers, kind='stable')]
+    centers = np.sort(centers, kind='stable')
+
+    lines = []
+    line_start = 0
+    for index in range(1, len(boxes) + 1):
+        if index == len(boxes) or centers[index] - centers[index - 1] > glyph_height / 2:
+            line = boxes[line_start:index]
+            lines.append([tuple(box) for box in line[np.argsort(line[:, 0], kind='stable')]])
+            line_start = index
+
+    return lines
+
+
+def normalize_glyphs(thresh, boxes):
+    """Crop each glyph, pad it to a common aspect ratio and return them as zero-mean, unit-norm row vectors."""
+    glyph_width, glyph_height = DIGIT_GLYPH_SIZE
+    vectors = np.empty((len(boxes), glyph_width * glyph_height), dtype=np.float32)
+
+    for index, (x, y, w, h) in enumerate(boxes):
+        glyph = 255 - thresh[y:y + h, x:x + w]
+        canvas_width = max(w, int(h * glyph_width / glyph_height))
+        canvas = np.zeros((h, canvas_width), dtype=np.uint8)
+        left = (canvas_width - w) // 2
+        canvas[:, left:left + w] = glyph
+        vectors[index] = cv2.resize(canvas, DIGIT_GLYPH_SIZE, interpolation=cv2.INTER_AREA).ravel()
+
+    vectors -= vectors.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class DigitRecognizer:
+    """
+    Reads digits written in the game font by comparing each glyph to an atlas of known digit glyphs.
+
+    All the glyphs of an image are compared to all the atlas entries with a single matrix product, the
+    score of a glyph being its normalized correlation with the closest atlas entry.
+    """
+
+    def __init__(self, glyphs, labels):
+        self.glyphs = glyphs
+        self.labels = labels
+
+    @classmethod
+    def load(cls, path=DIGIT_ATLAS_PATH):
+        atlas = np.load(path)
+        return cls(atlas['glyphs'], atlas['labels'])
+
+    def save(self, path=DIGIT_ATLAS_PATH):
+        np.savez_compressed(path, glyphs=self.glyphs, labels=self.labels)
+
+    @classmethod
+    def build(cls, samples):
+        """
+        Build an atlas from (thresholded image, expected digits) samples.
+
+        Samples whose glyph count does not match the number of expected digits are skipped.
+        """
+        glyphs, labels = [], []
+        for thresh, expected in samples:
+            digits = re.sub(r'\D', '', expected)
+            boxes = [box for line in segment_glyphs(thresh) for box in line]
+            if len(boxes) != len(digits):
+                debug_print(f"Sample '{expected}' skipped: {len(boxes)} glyphs found for {len(digits)} digits.")
+                continue
+            glyphs.append(normalize_glyphs(thresh, boxes))
+            labels.extend(digits)
+
+        if not glyphs:
+            return None
+        return cls(np.concatenate(glyphs), np.array(labels))
+
+    def recognize(self, thresh):
+        """
+        Returns:
+        list: One list of (value, confidence) per text line, the confidence of a value being the lowest
+        score among its glyphs.
+        """
+        lines = segment_glyphs(thresh)
+        boxes = [box for line in lines for box in line]
+        if not boxes:
+            return []
+
+        scores = normalize_glyphs(thresh, boxes) @ self.glyphs.T
+        best = scores.argmax(axis=1)
+        characters = self.labels[best]
+        confidences = scores[np.arange(len(boxes)), best]
+
+        result = []
+        index = 0
+        for line in lines:
+            glyph_height = np.median([box[3] for box in line])
+            values = []
+            value, confidence = '', 1.0
+            for position, box in enumerate(line):
+                if position > 0:
+                    previous = line[position - 1]
+                    if box[0] - (previous[0] + previous[2]) > glyph_height * DIGIT_SPACE_RATIO:
+                        values.append((value, confidence))
+                        value, confidence = '', 1.0
+                value += characters[index]
+                confidence = min(confidence, float(confidences[index]))
+                index += 1
+            values.append((value, confidence))
+            result.append(values)
+
+        return result
+
+    def read(self, thresh):
+        """
+        Returns:
+        tuple: The text, formatted like the OCR output (values separated by spaces, one line per row),
+        and the lowest confidence among its values.
+        """
+        lines = self.recognize(thresh)
+        if not lines:
+            return '', 0.0
+
+        text = '\n'.join(' '.join(value for value, _ in line) for line in lines)
+        confidence = min(confidence for line in lines for _, confidence in line)
+        return text, confidence
+
+
+_digit_recognizer = None
+_digit_recognizer_loaded = False
+_digit_recognizer_lock = threading.Lock()
+
+
+def get_digit_recognizer():
+    # The atlas is loaded on first use. Returns None when no atlas has been built yet.
+    global _digit_recognizer, _digit_recognizer_loaded
+    with _digit_recognizer_lock:
+        if not _digit_recognizer_loaded:
+            _digit_recognizer_loaded = True
+            if os.path.exists(DIGIT_ATLAS_PATH):
+                _digit_recognizer = DigitRecognizer.load()
+                debug_print(f"Digit atlas loaded: {len(_digit_recognizer.labels)} glyphs.")
+            else:
+                debug_print("No digit atlas found, digits will be read with OCR.")
+        return _digit_recognizer
+
+
+def build_atlas_from_folder(folder, path=DIGIT_ATLAS_PATH):
+    """
+    Build the digit atlas from ROI screenshots (such as the debug roi.png and quantity_roi.png).
+
+    Each file name must start with the digits it shows, in reading order, followed by an underscore.
+    For example, a price table reading "1 1250 / 10 11000" is saved as 112501011000_table.png.
+    """
+    samples = []
+    for file_name in sorted(os.listdir(folder)):
+        match = re.match(r'(\d+)_', file_name)
+        if not match:
+            continue
+        image = cv2.imread(os.path.join(folder, file_name))
+        if image is None:
+            continue
+        samples.append((binarize(image)[1], match.group(1)))
+
+    recognizer = DigitRecognizer.build(samples)
+    if recognizer is None:
+        print(f"No usable sample found in {folder}.")
+        return None
+
+    recognizer.save(path)
+    print(f"Digit atlas saved to {path}: {len(recognizer.labels)} glyphs from {len(samples)} samples.")
+    return recognizer
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python -m utils.digits <samples_folder>")
+        sys.exit(1)
+    build_atlas_from_folder(sys.argv[1])
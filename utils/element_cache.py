@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+
+from utils.constants import ELEMENT_CACHE_PATH
+from utils.debug_utils import debug_print
+from utils.templates import template_store
+
+
+class ElementCache:
+    """
+    Keeps the raw position of every located cue on disk, so elements do not have to be searched again
+    after a restart.
+
+    Entries are grouped by game window size, and an entry is ignored if the cue file it was found with
+    has changed since. Positions are relative to the game window, so they stay valid when it is moved, and
+    are shared by game clients of the same size.
+    """
+
+    def __init__(self, path=ELEMENT_CACHE_PATH):
+        self.path = path
+        self.entries = None
+        # Elements may be located from several threads at once
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def window_key(window_size):
+        return f"{window_size[0]}x{window_size[1]}"
+
+    def load(self):
+        with self.lock:
+            self.entries = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r') as cache_file:
+                        self.entries = json.load(cache_file)
+                except (OSError, ValueError):
+                    debug_print(f"Element cache {self.path} could not be read, starting from an empty cache.")
+            return self.entries
+
+    def save(self):
+        with self.lock:
+            with open(self.path, 'w') as cache_file:
+                json.dump(self.entries, cache_file, indent=4)
+
+    def get(self, key, window_size):
+        # Returns the (cue_path, (x, y, w, h)) stored for key, or None if missing or outdated.
+        if self.entries is None:
+            self.load()
+
+        entry = self.entries.get(self.window_key(window_size), {}).get(key)
+        if entry is None:
+            return None
+
+        if entry['cue_hash'] != template_store.get_hash(entry['cue_path']):
+            debug_print(f"Cue of {key} has changed since it was cached.")
+            return None
+
+        return entry['cue_path'], (entry['x'], entry['y'], entry['w'], entry['h'])
+
+    def set(self, key, window_size, cue_path, loc, size):
+        with self.lock:
+            if self.entries is None:
+                self.load()
+
+            self.entries.setdefault(self.window_key(window_size), {})[key] = {
+                'cue_path': cue_path,
+                'cue_hash': template_store.get_hash(cue_path),
+                'x': int(loc[0]),
+                'y': int(loc[1]),
+                'w': int(size[0]),
+                'h': int(size[1]),
+            }
+            self.save()
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+element_cache = ElementCache()
@@ -0,0 +1,62 @@
+import threading
+
+import cv2
+
+from utils.ocr import binarize
+
+
+class Frame:
+    """
+    A captured BGR image, along with what is derived from it, computed on first use and shared by every reader
+    of the frame: its grayscale version, its grayscale pyramid levels and its binarized regions.
+
+    Slicing a frame slices its BGR image, so frames can be used wherever a region of the screenshot is read.
+    Functions taking the whole image, like OpenCV ones, need frame.image.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.gray_levels = []
+        self.binarized_regions = {}
+        # Elements of one frame are searched from several threads at once
+        self.lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def __getitem__(self, index):
+        return self.image[index]
+
+    @property
+    def gray(self):
+        return self.pyramid_level(0)
+
+    def pyramid_level(self, level):
+        # Returns the grayscale image halved level times.
+        with self.lock:
+            if not self.gray_levels:
+                self.gray_levels.append(cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+            while len(self.gray_levels) <= level:
+                self.gray_levels.append(cv2.pyrDown(self.gray_levels[-1]))
+            return self.gray_levels[level]
+
+    def binarized(self, region):
+        """
+        Binarize a (x, y, w, h) region of the frame for text recognition, see ocr.binarize.
+
+        Returns:
+        tuple: The upscaled grayscale region and the thresholded region.
+        """
+        region = tuple(int(value) for value in region)
+        result = self.binarized_regions.get(region)
+        if result is None:
+            x, y, w, h = region
+            result = binarize(self.gray[y:y + h, x:x + w])
+            self.binarized_regions[region] = result
+        return result
+
+
+def as_frame(image):
+    # Wraps a BGR image, as read from disk, in a Frame. Frames are returned as is.
+    return image if isinstance(image, Frame) else Frame(image)
@@ -1,5 +1,10 @@
+import sys
+import threading
+import time
+
+from utils.constants import WINDOW_REFRESH_INTERVAL, WAIT_POLL_INTERVAL
 from utils.debug_utils import debug_print
-import pygetwindow as gw
+from utils.timing import timings
 
 DOFUS_FOCUSED = False
 
@@ -26,15 +31,248 @@ def to_search_area(corners, screen_size):
     )
 
 
+class PygetwindowBackend:
+    """Finds the game window among the desktop windows."""
+
+    def __init__(self):
+        import pygetwindow
+        self.gw = pygetwindow
+
+    def find_game_window(self):
+        # Walks every top-level window: only called when the tracked window is unknown or gone.
+        game_windows = [w for w in self.gw.getWindowsWithTitle('- Dofus') if w.visible]
+        if not game_windows:
+            debug_print("Dofus game window not found.")
+            return None
+        return game_windows[0]
+
+    def get_focused_game_window(self):
+        window = self.gw.getActiveWindow()
+        if window is None or '- Dofus' not in window.title:
+            return None
+        return window
+
+    def get_window_id(self, window):
+        return window._hWnd
+
+    def get_window_name(self, window):
+        return window.title.split(' - ')[0]
+
+    def activate(self, window):
+        try:
+            window.activate()
+        except self.gw.PyGetWindowException as error:
+            debug_print(f"Game window could not be focused: {error}")
+
+    def get_geometry(self, window):
+        # Returns the (x, y, w, h) screen rects of the window and of its client area, or None if it is gone.
+        try:
+            if not window.visible:
+                return None
+            window_rect = (window.left, window.top, window.width, window.height)
+        except self.gw.PyGetWindowException:
+            return None
+        return window_rect, get_client_rect(window) or window_rect
+
+    def is_focused(self, window):
+        return window == self.gw.getActiveWindow()
+
+
+def get_client_rect(window):
+    # Client area of a pygetwindow window in screen coordinates, which is only available on Windows.
+    if sys.platform != 'win32':
+        return None
+
+    import ctypes
+    from ctypes import wintypes
+
+    rect = wintypes.RECT()
+    origin = wintypes.POINT(0, 0)
+    user32 = ctypes.windll.user32
+    if not user32.GetClientRect(window._hWnd, ctypes.byref(rect)) \
+            or not user32.ClientToScreen(window._hWnd, ctypes.byref(origin)):
+        return None
+    return origin.x, origin.y, rect.right - rect.left, rect.bottom - rect.top
+
+
+class StubWindowBackend:
+    """
+    Pretends a game window of the given size is open, for headless runs.
+
+    Without a client_rect, the game is not known to cover any particular part of the screen.
+    """
+
+    def __init__(self, size, focused=True, client_rect=None):
+        self.size = tuple(size)
+        self.focused = focused
+        self.client_rect = tuple(client_rect) if client_rect is not None else None
+
+    def find_game_window(self):
+        return self
+
+    def get_focused_game_window(self):
+        return self if self.focused else None
+
+    def get_window_id(self, window):
+        return id(window)
+
+    def get_window_name(self, window):
+        return 'stub'
+
+    def activate(self, window):
+        self.focused = True
+
+    def get_geometry(self, window):
+        return (0, 0) + self.size, self.client_rect
+
+    def is_focused(self, window):
+        return self.focused
+
+
+class WindowTracker:
+    """
+    Keeps track of the game window, so the desktop windows are not enumerated on every lookup.
+
+    The window is resolved once, then only its geometry and focus are read again, at most every
+    WINDOW_REFRESH_INTERVAL seconds. It is resolved again when it closes, or after invalidate(), e.g. when
+    a lookup relying on its geometry failed.
+
+    A tracker given a window only ever tracks that one, as when several game clients are open.
+    """
+
+    def __init__(self, backend, window=None, refresh_interval=WINDOW_REFRESH_INTERVAL):
+        self.backend = backend
+        self.pinned_window = window
+        self.refresh_interval = refresh_interval
+        self.window = window
+        self.window_rect = None
+        self.client_rect = None
+        self.focused = False
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        with self.lock:
+            self.window = None
+            self.refreshed_at = None
+
+    def refresh(self, force=False):
+        with self.lock:
+            now = time.perf_counter()
+            if not force and self.refreshed_at is not None and now - self.refreshed_at < self.refresh_interval:
+                return
+
+            window = self.window if self.window is not None else self.pinned_window
+            geometry = self.backend.get_geometry(window) if window is not None else None
+            if geometry is None and self.pinned_window is None:
+                window = self.backend.find_game_window()
+                geometry = self.backend.get_geometry(window) if window is not None else None
+
+            if geometry is None:
+                self.window, self.window_rect, self.client_rect, self.focused = None, None, None, False
+            else:
+                self.window = window
+                window_rect, self.client_rect = geometry
+                if self.window_rect is None or window_rect[2:] != self.window_rect[2:]:
+                    debug_print(f"Game window size: {window_rect[2]}x{window_rect[3]}")
+                self.window_rect = window_rect
+                self.focused = self.backend.is_focused(self.window)
+            self.refreshed_at = now
+
+    def get_size(self):
+        self.refresh()
+        if self.window_rect is None:
+            return None, None
+        return self.window_rect[2], self.window_rect[3]
+
+    def get_rect(self):
+        self.refresh()
+        return self.window_rect
+
+    def get_client_rect(self):
+        self.refresh()
+        return self.client_rect
+
+    def activate(self, timeout=0.0):
+        """
+        Bring the tracked window to the foreground, if it is not already, and wait up to timeout seconds for the
+        system to report it focused.
+
+        Returns:
+        bool: True if the window had to be brought to the foreground.
+        """
+        if self.is_focused(force=True) or self.window is None:
+            return False
+
+        deadline = time.perf_counter() + timeout
+        self.backend.activate(self.window)
+        self.refresh(force=True)
+        while not self.focused and time.perf_counter() < deadline:
+            time.sleep(WAIT_POLL_INTERVAL)
+            self.refresh(force=True)
+        return True
+
+    def is_focused(self, force=False):
+        self.refresh(force)
+        return self.focused
+
+
+window_backend = None
+window_tracker = None
+# Threads working on one game client among several track it rather than the first game window found
+thread_trackers = threading.local()
+
+
+def get_window_backend():
+    global window_backend
+    if window_backend is None:
+        window_backend = PygetwindowBackend()
+    return window_backend
+
+
+def set_window_backend(backend):
+    # Replaces the window backend, e.g. with a StubWindowBackend for headless runs. Returns the previous one.
+    global window_backend, window_tracker
+    previous, window_backend = window_backend, backend
+    window_tracker = None
+    return previous
+
+
+def set_thread_window_tracker(tracker):
+    # Makes the window functions below use tracker in the calling thread, or the global tracker again for None.
+    thread_trackers.tracker = tracker
+
+
+def get_window_tracker():
+    global window_tracker
+    tracker = getattr(thread_trackers, 'tracker', None)
+    if tracker is not None:
+        return tracker
+    if window_tracker is None:
+        window_tracker = WindowTracker(get_window_backend())
+    return window_tracker
+
+
+@timings.timed('window')
 def get_game_window_size():
-    game_window = [w for w in gw.getWindowsWithTitle('- Dofus') if w.visible]
-    if game_window:
-        window = game_window[0]
-        debug_print(f"Game window size: {window.width}x{window.height}")
-        return window.width, window.height
-    else:
-        debug_print("Dofus game window not found.")
-        return None, None
+    return get_window_tracker().get_size()
+
+
+@timings.timed('window')
+def get_game_client_rect():
+    # Returns the (x, y, w, h) screen rect of the game client area, or None if unknown.
+    return get_window_tracker().get_client_rect()
+
+
+@timings.timed('window')
+def get_game_window_origin():
+    # Returns the (x, y) screen position of the game window, or (0, 0) if unknown.
+    rect = get_window_tracker().get_rect()
+    return (rect[0], rect[1]) if rect is not None else (0, 0)
+
+
+def invalidate_game_window():
+    get_window_tracker().invalidate()
 
 
 def refresh_focus_status():
@@ -42,11 +280,16 @@ def refresh_focus_status():
     DOFUS_FOCUSED = is_game_window_open_and_focused()
 
 
-def is_game_window_open_and_focused():
-    game_windows = [w for w in gw.getWindowsWithTitle('- Dofus') if w.visible]
-    focused_window = gw.getActiveWindow()
-    if focused_window and any(focused_window.title == w.title for w in game_windows):
-        debug_print(f"Game window {focused_window.title} is focused.")
-        return True
-    return False
+def is_game_window_focused():
+    # Cached focus state, cheap enough to be polled.
+    return get_window_tracker().is_focused()
 
+
+@timings.timed('window')
+def is_game_window_open_and_focused():
+    # Always reads the current focus: it is checked once per hotkey press, right before acting on the game.
+    tracker = get_window_tracker()
+    focused = tracker.is_focused(force=True)
+    if focused:
+        debug_print("Game window is focused.")
+    return focused
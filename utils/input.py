@@ -0,0 +1,192 @@
+import contextlib
+import threading
+import time
+
+from utils.config import config_store
+from utils.constants import INPUT_PACING_KEY, INPUT_PACING_PROFILES, DEFAULT_INPUT_PACING
+from utils.debug_utils import debug_print
+from utils.timing import timings
+
+
+def get_pacing_profile():
+    # Returns the pacing profile selected in the config, or the default one if it does not exist.
+    name = config_store.get(INPUT_PACING_KEY) or DEFAULT_INPUT_PACING
+    if name not in INPUT_PACING_PROFILES:
+        debug_print(f"Unknown input pacing profile {name}, using {DEFAULT_INPUT_PACING}.")
+        name = DEFAULT_INPUT_PACING
+    return INPUT_PACING_PROFILES[name]
+
+
+class InputBackend:
+    """
+    Sends mouse and keyboard input to the game.
+
+    Actions are (name, *args) tuples, e.g. ('click', x, y) or ('typewrite', '1250'). A sequence of them is
+    sent as one batch by send(), paced by the configured profile. The single action methods send a batch
+    of one action.
+    """
+
+    name = 'base'
+
+    def send(self, actions):
+        raise NotImplementedError
+
+    def click(self, x, y):
+        self.send([('click', x, y)])
+
+    def press(self, key):
+        self.send([('press', key)])
+
+    def hotkey(self, *keys):
+        self.send([('hotkey',) + keys])
+
+    def typewrite(self, text):
+        self.send([('typewrite', text)])
+
+    def position(self):
+        raise NotImplementedError
+
+    def move_to(self, position):
+        raise NotImplementedError
+
+
+class PyautoguiInput(InputBackend):
+    """
+    Sends input through pyautogui, without its global PAUSE after every call.
+
+    The delays come from the pacing profile instead: action_interval between the actions of a batch,
+    key_interval between the keys typed by typewrite, and pause once the whole batch has been sent.
+    """
+
+    name = 'pyautogui'
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def send(self, actions):
+        profile = get_pacing_profile()
+        with timings.span('input'):
+            for index, (name, *args) in enumerate(actions):
+                if index > 0 and profile['action_interval'] > 0:
+                    time.sleep(profile['action_interval'])
+                self.dispatch(name, args, profile)
+            if profile['pause'] > 0:
+                time.sleep(profile['pause'])
+
+    def dispatch(self, name, args, profile):
+        if name == 'click':
+            self.pyautogui.click(*args, _pause=False)
+        elif name == 'press':
+            self.pyautogui.press(*args, _pause=False)
+        elif name == 'hotkey':
+            self.pyautogui.hotkey(*args, _pause=False)
+        elif name == 'typewrite':
+            self.pyautogui.typewrite(*args, interval=profile['key_interval'], _pause=False)
+        else:
+            raise ValueError(f"Unknown input action: {name}")
+
+    def position(self):
+        return tuple(self.pyautogui.position())
+
+    def move_to(self, position):
+        self.pyautogui.moveTo(position, _pause=False)
+
+
+class RecordingInput(InputBackend):
+    """
+    Records every action with its time, and forwards it to another backend if one is given.
+
+    Without a backend, no input is sent at all, which makes it usable as a stub for headless runs.
+    listener, if given, is called with each recorded action.
+    """
+
+    name = 'recording'
+
+    def __init__(self, backend=None, listener=None):
+        self.backend = backend
+        self.listener = listener
+        self.actions = []
+        self.mouse_position = (0, 0)
+
+    def record(self, name, *args):
+        action = {'time': time.perf_counter(), 'name': name, 'args': list(args)}
+        self.actions.append(action)
+        if self.listener is not None:
+            self.listener(action)
+
+    def send(self, actions):
+        # Every action of the batch is recorded on its own, and the batch is forwarded as a whole.
+        for name, *args in actions:
+            self.record(name, *args)
+        if self.backend is not None:
+            self.backend.send(actions)
+
+    def position(self):
+        if self.backend is not None:
+            return self.backend.position()
+        return self.mouse_position
+
+    def move_to(self, position):
+        if self.backend is not None:
+            self.backend.move_to(position)
+        else:
+            self.mouse_position = tuple(position)
+
+
+class SerializedInput(InputBackend):
+    """
+    Sends batches through the current input backend one at a time, as several game clients may be sold on at once.
+
+    prepare, if given, is called right before each batch while no other batch can be sent, e.g. to focus the
+    game client the batch is meant for. focus, if given, brings that client to the front for focused().
+    """
+
+    name = 'serialized'
+
+    def __init__(self, prepare=None, focus=None):
+        self.prepare = prepare
+        self.focus = focus
+
+    @contextlib.contextmanager
+    def focused(self):
+        # Keeps the client of this input in front while the block runs, e.g. while it is captured: no batch
+        # can be sent meanwhile, so no other client can be focused back.
+        with _dispatch_lock:
+            if self.focus is not None:
+                self.focus()
+            yield
+
+    def send(self, actions):
+        with _dispatch_lock:
+            if self.prepare is not None:
+                self.prepare()
+            get_input().send(actions)
+
+    def position(self):
+        return get_input().position()
+
+    def move_to(self, position):
+        with _dispatch_lock:
+            get_input().move_to(position)
+
+
+_input = None
+_input_lock = threading.Lock()
+_dispatch_lock = threading.RLock()
+
+
+def get_input():
+    global _input
+    with _input_lock:
+        if _input is None:
+            _input = PyautoguiInput()
+        return _input
+
+
+def set_input(backend):
+    # Replaces the input backend, e.g. with a RecordingInput for headless runs. Returns the previous one.
+    global _input
+    with _input_lock:
+        previous, _input = _input, backend
+        return previous
@@ -0,0 +1,150 @@
+import cv2
+
+from utils.constants import MATCH_PYRAMID_LEVELS, MATCH_MIN_COARSE_TEMPLATE_SIZE, MATCH_REFINE_CANDIDATES, \
+    MATCH_REFINE_MARGIN
+from utils.debug_utils import debug_print
+from utils.templates import template_store
+
+
+class MatchResult:
+    def __init__(self, loc, size, score, scale):
+        self.loc = loc
+        self.size = size
+        self.score = score
+        self.scale = scale
+
+    def __str__(self):
+        return f"MatchResult(loc={self.loc}, size={self.size}, score={self.score:.3f}, scale={self.scale:.3f})"
+
+
+def build_pyramid(image, levels):
+    """Return the image followed by `levels` successively half-sized copies of it."""
+    pyramid = [image]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+def match_template(image, template):
+    """Return the best TM_CCOEFF_NORMED score and its location, or (-1, None) if the template does not fit."""
+    if image.shape[0] < template.shape[0] or image.shape[1] < template.shape[1]:
+        return -1.0, None
+
+    result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return max_val, max_loc
+
+
+def template_size(template, scale):
+    template_height, template_width = template.shape[:2]
+    return int(template_width * scale), int(template_height * scale)
+
+
+def find_template(search_area, template_path, scales, window_size, threshold, levels=MATCH_PYRAMID_LEVELS,
+                  coarse_area=None):
+    """
+    Look for a template in the search area over several candidate scales.
+
+    The scales are first ranked on a downsampled pyramid level of the search area, then only the
+    best candidates are matched at full resolution, in a small window around their coarse location.
+    Fewer levels are used for small templates, and a full resolution search when they are too small to be
+    downsampled at all.
+
+    A grayscale search area is matched against grayscale templates, a third of the work of matching BGR ones.
+    coarse_area, if given, returns the search area downsampled a given number of times, e.g. from the
+    pyramid of a Frame, instead of it being built for each search.
+
+    Returns:
+    MatchResult: The first candidate meeting the threshold, or None.
+    """
+    template = template_store.get(template_path)
+    if template is None:
+        return None
+
+    sizes = [(scale, template_size(template, scale)) for scale in scales]
+    sizes = [(scale, size) for scale, size in sizes
+             if 0 < size[0] <= search_area.shape[1] and 0 < size[1] <= search_area.shape[0]]
+    if not sizes:
+        debug_print(f"Template image is larger than the search area. Search area size: {search_area.shape}")
+        return None
+
+    # Use as many pyramid levels as the smallest template allows
+    smallest_side = min(min(size) for _, size in sizes)
+    while levels > 0 and smallest_side // 2 ** levels < MATCH_MIN_COARSE_TEMPLATE_SIZE:
+        levels -= 1
+    if levels == 0:
+        return find_template_full_resolution(search_area, template_path, sizes, window_size, threshold)
+
+    ratio = 2 ** levels
+
+    gray = search_area.ndim == 2
+    coarse_image = coarse_area(levels) if coarse_area is not None else build_pyramid(search_area, levels)[-1]
+    candidates = []
+    for index, (scale, size) in enumerate(sizes):
+        coarse_size = (size[0] // ratio, size[1] // ratio)
+        coarse_template = template_store.get_scaled(template_path, coarse_size, window_size,
+                                                    interpolation=cv2.INTER_AREA, gray=gray)
+        score, loc = match_template(coarse_image, coarse_template)
+        if loc is not None:
+            candidates.append((score, index, loc))
+
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    # Neighbouring scales often round to the same coarse template size, so the coarse ranking cannot
+    # tell them apart: the scales next to the best candidates are refined as well.
+    coarse_locs = {index: loc for _, index, loc in candidates}
+    refine_indices = []
+    for _, index, _ in candidates[:MATCH_REFINE_CANDIDATES]:
+        for neighbour in (index, index - 1, index + 1):
+            if neighbour in coarse_locs and neighbour not in refine_indices:
+                refine_indices.append(neighbour)
+
+    search_height, search_width = search_area.shape[:2]
+    margin = MATCH_REFINE_MARGIN + ratio
+    best = None
+    for index in refine_indices:
+        scale, size = sizes[index]
+        coarse_loc = coarse_locs[index]
+        left = max(0, coarse_loc[0] * ratio - margin)
+        top = max(0, coarse_loc[1] * ratio - margin)
+        right = min(search_width, coarse_loc[0] * ratio + size[0] + margin)
+        bottom = min(search_height, coarse_loc[1] * ratio + size[1] + margin)
+
+        template_resized = template_store.get_scaled(template_path, size, window_size, gray=gray)
+        score, loc = match_template(search_area[top:bottom, left:right], template_resized)
+        if loc is None:
+            continue
+
+        match = MatchResult((loc[0] + left, loc[1] + top), size, score, scale)
+        if score >= threshold:
+            return match
+        if best is None or score > best.score:
+            best = match
+
+    if best is not None:
+        debug_print(f"Best match below threshold: {best}")
+    return None
+
+
+def find_template_full_resolution(search_area, template_path, sizes, window_size, threshold):
+    for scale, size in sizes:
+        template_resized = template_store.get_scaled(template_path, size, window_size, gray=search_area.ndim == 2)
+        score, loc = match_template(search_area, template_resized)
+        if loc is not None and score >= threshold:
+            return MatchResult(loc, size, score, scale)
+    return None
+
+
+def check_template_at(image, template_path, rect, window_size, threshold, margin=MATCH_REFINE_MARGIN):
+    """Check that the template, resized to the rect size, is still found at the rect position (x, y, w, h)."""
+    x, y, w, h = rect
+    image_height, image_width = image.shape[:2]
+    left, top = max(0, x - margin), max(0, y - margin)
+    right, bottom = min(image_width, x + w + margin), min(image_height, y + h + margin)
+
+    template_resized = template_store.get_scaled(template_path, (w, h), window_size, gray=image.ndim == 2)
+    if template_resized is None:
+        return False
+
+    score, loc = match_template(image[top:bottom, left:right], template_resized)
+    return loc is not None and score >= threshold
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from pytesseract import pytesseract
+
+from utils.constants import CUSTOM_TESSERACT_CONFIG, TESSERACT_CMD, OCR_LANGUAGE, OCR_CHAR_WHITELIST, \
+    OCR_UPSCALE_FACTOR, OCR_BINARY_THRESHOLD, WHITE, OCR_CACHE_SIZE, OCR_BATCH_SPACING
+from utils.debug_utils import debug_print
+
+pytesseract.tesseract_cmd = TESSERACT_CMD
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+def binarize(roi):
+    """
+    Prepare a BGR or grayscale region for text recognition: grayscale, upscaled, then thresholded to dark
+    text on white.
+
+    Returns:
+    tuple: The upscaled grayscale image and the thresholded image.
+    """
+    gray = roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    # upgrade resolution
+    gray = cv2.resize(gray, None, fx=OCR_UPSCALE_FACTOR, fy=OCR_UPSCALE_FACTOR, interpolation=cv2.INTER_CUBIC)
+    _, thresh = cv2.threshold(gray, OCR_BINARY_THRESHOLD, WHITE, cv2.THRESH_BINARY_INV)
+    return gray, thresh
+
+
+class OcrEngine:
+    """Reads the text of binarized NumPy images."""
+
+    name = 'base'
+
+    def read(self, image):
+        raise NotImplementedError
+
+    def read_batch(self, images):
+        return [self.read(image) for image in images]
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Runs a new tesseract process for every image. Slow, but only needs the tesseract executable."""
+
+    name = 'pytesseract'
+
+    def read(self, image):
+        return pytesseract.image_to_string(image, config=CUSTOM_TESSERACT_CONFIG)
+
+    def read_batch(self, images):
+        # The images are stacked into one, read by a single process, one line of text per image. They are read
+        # one by one if the lines do not match them, e.g. when one of them has no text.
+        if len(images) < 2:
+            return [self.read(image) for image in images]
+
+        width = max(image.shape[1] for image in images)
+        stacked = np.vstack([cv2.copyMakeBorder(image, 0, OCR_BATCH_SPACING, 0, width - image.shape[1],
+                                                cv2.BORDER_CONSTANT, value=WHITE) for image in images])
+        lines = [line for line in self.read(stacked).splitlines() if line.strip()]
+        if len(lines) != len(images):
+            debug_print(f"{len(lines)} lines read for {len(images)} stacked images, reading them one by one.")
+            return [self.read(image) for image in images]
+        return lines
+
+
+class TesserocrEngine(OcrEngine):
+    """Keeps the tesseract library and its language model loaded in process, and reads NumPy buffers directly."""
+
+    name = 'tesserocr'
+
+    def __init__(self, tessdata_path, language=OCR_LANGUAGE):
+        self.api = tesserocr.PyTessBaseAPI(path=tessdata_path, lang=language,
+                                           psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.DEFAULT)
+        self.api.SetVariable('tessedit_char_whitelist', OCR_CHAR_WHITELIST)
+        # The tesseract API holds a single image at a time
+        self.lock = threading.Lock()
+
+    def _read_unlocked(self, image):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        self.api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        return self.api.GetUTF8Text()
+
+    def read(self, image):
+        with self.lock:
+            return self._read_unlocked(image)
+
+    def read_batch(self, images):
+        with self.lock:
+            return [self._read_unlocked(image) for image in images]
+
+    def close(self):
+        with self.lock:
+            self.api.End()
+
+
+class FallbackOcrEngine(OcrEngine):
+    """Uses the primary engine, and the fallback engine for any image the primary one fails on."""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f'{primary.name} (fallback: {fallback.name})'
+
+    def read(self, image):
+        try:
+            return self.primary.read(image)
+        except RuntimeError as error:
+            debug_print(f"{self.primary.name} failed ({error}), using {self.fallback.name}.")
+            return self.fallback.read(image)
+
+    def read_batch(self, images):
+        try:
+            return self.primary.read_batch(images)
+        except RuntimeError as error:
+            debug_print(f"{self.primary.name} failed ({error}), using {self.fallback.name}.")
+            return self.fallback.read_batch(images)
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+
+class OcrResultCache:
+    """
+    Remembers the text read on the last binarized images, so an unchanged region is never read twice.
+
+    Images are keyed by a hash of their bytes and shape, the least recently used entry being evicted
+    once max_size entries are stored.
+    """
+
+    def __init__(self, max_size=OCR_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(image):
+        image = np.ascontiguousarray(image)
+        return image.shape, hashlib.blake2b(image, digest_size=16).digest()
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def set(self, key, text):
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+
+ocr_result_cache = OcrResultCache()
+
+
+def get_tessdata_path():
+    tessdata_path = os.environ.get('TESSDATA_PREFIX')
+    if tessdata_path:
+        return tessdata_path
+    return os.path.join(os.path.dirname(TESSERACT_CMD), 'tessdata')
+
+
+def create_ocr_engine():
+    fallback = PytesseractEngine()
+    if tesserocr is None:
+        debug_print("tesserocr is not installed, OCR will run through the tesseract executable.")
+        return fallback
+
+    try:
+        engine = TesserocrEngine(get_tessdata_path())
+    except RuntimeError as error:
+        debug_print(f"Could not start the in-process OCR engine ({error}), using the tesseract executable.")
+        return fallback
+
+    return FallbackOcrEngine(engine, fallback)
+
+
+_ocr_engine = None
+_ocr_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    # The engine is created on first use and then reused for the whole session.
+    global _ocr_engine
+    with _ocr_engine_lock:
+        if _ocr_engine is None:
+            _ocr_engine = create_ocr_engine()
+            debug_print(f"OCR engine: {_ocr_engine.name}")
+        return _ocr_engine
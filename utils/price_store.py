@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+import time
+
+from utils.constants import PRICE_STORE_PATH
+from utils.debug_utils import debug_print
+
+
+class PriceStore:
+    """
+    Keeps every price table read, per item, in a SQLite database.
+
+    An observation is the price of each quantity shown by the table of one item at one time. Items are
+    identified by a hash of their icon and name, see item_key in logic.py. Only the latest observation of an
+    item is used, and only while it is recent enough, so the table does not have to be read again when the
+    same item is sold several times in a row.
+    """
+
+    def __init__(self, path=PRICE_STORE_PATH):
+        self.path = path
+        self.connection = None
+        # The connection is shared by the workers of every game window
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS observations ('
+                'item TEXT NOT NULL, observed_at REAL NOT NULL, quantity INTEGER NOT NULL, price INTEGER NOT NULL)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS observations_item ON observations (item, observed_at)')
+            self.connection.commit()
+        return self.connection
+
+    def record(self, item, price_map, observed_at=None):
+        observed_at = observed_at if observed_at is not None else time.time()
+        with self.lock:
+            try:
+                connection = self.connect()
+                connection.executemany(
+                    'INSERT INTO observations (item, observed_at, quantity, price) VALUES (?, ?, ?, ?)',
+                    [(item, observed_at, quantity, price) for quantity, price in price_map.items()])
+                connection.commit()
+            except sqlite3.Error as error:
+                debug_print(f"Prices of item {item} could not be stored: {error}")
+
+    def get_fresh(self, item, max_age):
+        """
+        Get the latest prices observed for an item, if they are at most max_age seconds old.
+
+        Returns:
+        dict: The price of each quantity, or None if there is no recent enough observation.
+        """
+        with self.lock:
+            try:
+                connection = self.connect()
+                row = connection.execute(
+                    'SELECT MAX(observed_at) FROM observations WHERE item = ? AND observed_at >= ?',
+                    (item, time.time() - max_age)).fetchone()
+                if row[0] is None:
+                    return None
+                prices = connection.execute(
+                    'SELECT quantity, price FROM observations WHERE item = ? AND observed_at = ?',
+                    (item, row[0])).fetchall()
+            except sqlite3.Error as error:
+                debug_print(f"Prices of item {item} could not be read: {error}")
+                return None
+        return dict(prices)
+
+    def clear(self):
+        with self.lock:
+            try:
+                connection = self.connect()
+                connection.execute('DELETE FROM observations')
+                connection.commit()
+            except sqlite3.Error as error:
+                debug_print(f"Price store could not be cleared: {error}")
+
+
+_price_store = None
+_price_store_lock = threading.Lock()
+
+
+def get_price_store():
+    global _price_store
+    with _price_store_lock:
+        if _price_store is None:
+            _price_store = PriceStore()
+        return _price_store
+
+
+def set_price_store(store):
+    # Replaces the price store, e.g. with an in-memory one for benchmarks. Returns the previous one.
+    global _price_store
+    with _price_store_lock:
+        previous, _price_store = _price_store, store
+        return previous
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+
+import cv2
+
+from utils.capture import get_capture, set_capture, RecordingCapture, ReplayCapture
+from utils.debug_utils import debug_print
+from utils.helpers import get_game_window_size, get_game_client_rect, set_window_backend, StubWindowBackend
+from utils.input import get_input, set_input, RecordingInput
+
+SESSION_FILE_NAME = 'session.json'
+
+
+class SessionRecorder:
+    """
+    Records a live sell session to a folder: every full screen frame, every input action, and what was
+    detected on each frame.
+
+    The recorded detections serve as ground truth when the session is replayed, and can be corrected by
+    editing session.json.
+    """
+
+    def __init__(self, folder, process_type=None):
+        self.folder = folder
+        self.process_type = process_type
+        self.frames = []
+        self.actions = []
+        self.detections = []
+        self.window_size = None
+        self.client_rect = None
+        self.start_time = None
+        self.previous_capture = None
+        self.previous_input = None
+        self.lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def start(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self.start_time = time.perf_counter()
+        self.window_size = get_game_window_size()
+        self.client_rect = get_game_client_rect()
+        self.previous_capture = get_capture()
+        self.previous_input = get_input()
+        set_capture(RecordingCapture(self.previous_capture, self.on_frame))
+        set_input(RecordingInput(self.previous_input, listener=self.on_action))
+
+    def on_frame(self, frame):
+        with self.lock:
+            file_name = f'{len(self.frames):05d}.png'
+            # Low compression: recording should not slow the session down more than necessary
+            cv2.imwrite(os.path.join(self.folder, file_name), frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            self.frames.append({'file': file_name, 'time': self.elapsed()})
+
+    def on_action(self, action):
+        with self.lock:
+            self.actions.append({'time': self.elapsed(), 'name': action['name'], 'args': action['args']})
+
+    def record_detection(self, name, value):
+        with self.lock:
+            self.detections.append({'frame': len(self.frames) - 1, 'time': self.elapsed(),
+                                    'name': name, 'value': value})
+
+    def stop(self):
+        set_capture(self.previous_capture)
+        set_input(self.previous_input)
+
+        with open(os.path.join(self.folder, SESSION_FILE_NAME), 'w') as session_file:
+            json.dump({
+                'process_type': self.process_type,
+                'window_size': list(self.window_size) if self.window_size[0] is not None else None,
+                'client_rect': list(self.client_rect) if self.client_rect is not None else None,
+                'frames': self.frames,
+                'actions': self.actions,
+                'detections': self.detections,
+            }, session_file, indent=4)
+        debug_print(f"Session recorded to {self.folder}: {len(self.frames)} frames, {len(self.actions)} actions.")
+
+
+_recorder = None
+
+
+def start_recording(folder, process_type=None):
+    global _recorder
+    _recorder = SessionRecorder(folder, process_type)
+    _recorder.start()
+    return _recorder
+
+
+def stop_recording():
+    global _recorder
+    if _recorder is not None:
+        _recorder.stop()
+        _recorder = None
+
+
+def record_detection(name, value):
+    # Attaches a detection to the last recorded frame. Does nothing when no session is being recorded.
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record_detection(name, value)
+
+
+class Session:
+    """A session recorded by SessionRecorder."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, SESSION_FILE_NAME), 'r') as session_file:
+            data = json.load(session_file)
+
+        self.process_type = data['process_type']
+        self.window_size = tuple(data['window_size']) if data['window_size'] else None
+        self.client_rect = tuple(data['client_rect']) if data.get('client_rect') else None
+        self.frames = data['frames']
+        self.actions = data['actions']
+        self.detections = data['detections']
+
+    def frame_path(self, index):
+        return os.path.join(self.folder, self.frames[index]['file'])
+
+    def frame_paths(self):
+        return [self.frame_path(index) for index in range(len(self.frames))]
+
+
+class ReplayBackends:
+    """
+    Context manager replacing the capture, input and window backends with stubs replaying a session.
+
+    The recorded input actions of the replay are available in input.actions afterwards.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.capture = ReplayCapture.from_files(session.frame_paths())
+        self.input = RecordingInput(listener=self.capture.on_input)
+        self.window = StubWindowBackend(session.window_size, client_rect=session.client_rect)
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = (set_capture(self.capture), set_input(self.input), set_window_backend(self.window))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        capture, input_backend, window = self.previous
+        set_capture(capture)
+        set_input(input_backend)
+        set_window_backend(window)
+        return False
+
+
+def replay_session(session, run):
+    """
+    Calls run() with every backend replaced by stubs replaying the session.
+
+    Returns:
+    list: The input actions sent during the replay.
+    """
+    with ReplayBackends(session) as backends:
+        run()
+    return backends.input.actions
@@ -0,0 +1,58 @@
+import time
+
+from utils.debug_utils import debug_print
+from utils.timing import timings
+
+
+class StateMachine:
+    """
+    Runs a flow made of explicit states, from a start state until a final one.
+
+    A state is handled by a function taking the machine as argument, which does the work of the state and
+    returns the next state. States without a handler are final. Handlers share data through machine.data,
+    and return machine.fail(reason) when the flow cannot go on.
+
+    Every state visited is timed and kept in history, so a failed flow reports where and why it failed.
+    Once cancel_event, if given, is set, the flow fails before entering its next state.
+    """
+
+    def __init__(self, name, failed_state, data=None, cancel_event=None):
+        self.name = name
+        self.failed_state = failed_state
+        self.cancel_event = cancel_event
+        self.handlers = {}
+        self.data = data if data is not None else {}
+        self.history = []
+        self.failure = None
+
+    def add_state(self, state, handler):
+        self.handlers[state] = handler
+
+    def fail(self, reason):
+        self.failure = reason
+        return self.failed_state
+
+    def run(self, start):
+        # Returns the final state reached.
+        state = start
+        while state in self.handlers:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.history.append((getattr(state, 'value', state), 0.0))
+                state = self.fail("Aborted.")
+                break
+
+            started = time.perf_counter()
+            next_state = self.handlers[state](self)
+            duration = time.perf_counter() - started
+
+            state_name = getattr(state, 'value', state)
+            timings.record(f'state_{state_name}', duration)
+            self.history.append((state_name, duration))
+            state = next_state
+
+        path = ' -> '.join(f'{state_name} ({duration * 1000:.0f} ms)' for state_name, duration in self.history)
+        debug_print(f"{self.name}: {path} -> {getattr(state, 'value', state)}")
+        if state == self.failed_state:
+            failed_in = self.history[-1][0] if self.history else getattr(start, 'value', start)
+            debug_print(f"{self.name} failed in {failed_in}: {self.failure}")
+        return state
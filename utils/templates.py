@@ -0,0 +1,139 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from utils.constants import RES_PATH, TEMPLATE_WINDOW_SIZES
+from utils.debug_utils import debug_print
+
+
+class TemplateStore:
+    """
+    Keeps every cue image of the res folder in memory, along with the resized variants
+    computed for each game window size.
+
+    Resized variants and the best matching scale of each cue are only valid for one window
+    size. Those of the TEMPLATE_WINDOW_SIZES most recently used sizes are kept, so several game
+    clients of different sizes do not evict each other's.
+    """
+
+    def __init__(self, res_path=RES_PATH, max_window_sizes=TEMPLATE_WINDOW_SIZES):
+        self.res_path = res_path
+        self.max_window_sizes = max_window_sizes
+        self.templates = {}
+        self.gray_templates = {}
+        self.template_hashes = {}
+        # Per window size, most recently used last
+        self.window_entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load_all(self):
+        # Loads every cue image found at the root of the res folder.
+        if not os.path.isdir(self.res_path):
+            debug_print(f"Resources folder not found: {self.res_path}")
+            return
+
+        for file_name in sorted(os.listdir(self.res_path)):
+            if file_name.lower().endswith('.png'):
+                self.get(f'{self.res_path}{file_name}')
+
+        debug_print(f"{len(self.templates)} templates loaded.")
+
+    def get(self, template_path):
+        # Returns the original template image, reading it from disk only the first time.
+        template = self.templates.get(template_path)
+        if template is not None:
+            return template
+
+        if not os.path.exists(template_path):
+            debug_print(f"Template image not found: {template_path}")
+            return None
+
+        template = cv2.imread(template_path)
+        if template is None:
+            debug_print(f"Failed to load template image: {template_path}")
+            return None
+
+        self.templates[template_path] = template
+        return template
+
+    def get_hash(self, template_path):
+        # Returns the md5 hash of the template file, used to invalidate what was computed from an older version.
+        template_hash = self.template_hashes.get(template_path)
+        if template_hash is not None:
+            return template_hash
+
+        if not os.path.exists(template_path):
+            return None
+
+        with open(template_path, 'rb') as template_file:
+            template_hash = hashlib.md5(template_file.read()).hexdigest()
+        self.template_hashes[template_path] = template_hash
+        return template_hash
+
+    def get_window_entries(self, window_size):
+        # Returns the scaled templates and best scales of a window size, evicting the least recently used size.
+        with self.lock:
+            entries = self.window_entries.get(window_size)
+            if entries is None:
+                entries = {'scaled_templates': {}, 'best_scales': {}}
+                self.window_entries[window_size] = entries
+                if len(self.window_entries) > self.max_window_sizes:
+                    evicted_size, _ = self.window_entries.popitem(last=False)
+                    debug_print(f"Scaled templates of window size {evicted_size} evicted.")
+            else:
+                self.window_entries.move_to_end(window_size)
+            return entries
+
+    def get_best_scale(self, template_path, window_size):
+        return self.get_window_entries(window_size)['best_scales'].get(template_path)
+
+    def set_best_scale(self, template_path, window_size, scale):
+        self.get_window_entries(window_size)['best_scales'][template_path] = scale
+
+    def clear_best_scales(self):
+        with self.lock:
+            for entries in self.window_entries.values():
+                entries['best_scales'] = {}
+
+    def get_gray(self, template_path):
+        template = self.gray_templates.get(template_path)
+        if template is not None:
+            return template
+
+        template = self.get(template_path)
+        if template is None:
+            return None
+        template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+        self.gray_templates[template_path] = template
+        return template
+
+    def get_scaled(self, template_path, size, window_size, interpolation=cv2.INTER_CUBIC, gray=False):
+        # Returns the template, in grayscale if gray is set, resized to size (width, height) for the given
+        # game window size.
+        scaled_templates = self.get_window_entries(window_size)['scaled_templates']
+
+        key = (template_path, size, interpolation, gray)
+        template_resized = scaled_templates.get(key)
+        if template_resized is not None:
+            return template_resized
+
+        template = self.get_gray(template_path) if gray else self.get(template_path)
+        if template is None:
+            return None
+
+        template_resized = cv2.resize(template, size, interpolation=interpolation)
+        scaled_templates[key] = template_resized
+        return template_resized
+
+    def clear(self):
+        with self.lock:
+            self.templates = {}
+            self.gray_templates = {}
+            self.template_hashes = {}
+            self.window_entries = OrderedDict()
+
+
+template_store = TemplateStore()
@@ -0,0 +1,164 @@
+import csv
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from utils.constants import TIMING_BUCKETS_MS, TIMING_MAX_SAMPLES
+
+# This module is among the first ones imported, so this is close enough to when the app was started
+started_at = time.perf_counter()
+
+
+def since_start():
+    return time.perf_counter() - started_at
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+class Span:
+    """Records the time spent in a with block under a stage. The stage can be renamed before the block ends."""
+
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timings.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class StageTimings:
+    """
+    In-memory latency histograms of the stages of the sell process, and the number of items sold.
+
+    Every stage keeps its call count, total and maximum duration, its counts per TIMING_BUCKETS_MS bucket,
+    and its TIMING_MAX_SAMPLES most recent durations for percentiles. Stages may be nested, e.g. OCR within
+    a whole sell process, so durations of different stages do not add up.
+    """
+
+    def __init__(self, buckets_ms=TIMING_BUCKETS_MS, max_samples=TIMING_MAX_SAMPLES):
+        self.buckets_ms = buckets_ms
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.items = 0
+
+    def span(self, stage):
+        return Span(self, stage)
+
+    def timed(self, stage):
+        # Decorator recording every call of a function under a stage.
+        def decorator(function):
+            @functools.wraps(function)
+            def timed_function(*args, **kwargs):
+                with self.span(stage):
+                    return function(*args, **kwargs)
+
+            return timed_function
+
+        return decorator
+
+    def record(self, stage, duration):
+        duration_ms = duration * 1000
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(self.buckets_ms) + 1),
+                         'samples': deque(maxlen=self.max_samples)}
+                self.stages[stage] = entry
+
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['buckets'][self.bucket_index(duration_ms)] += 1
+            entry['samples'].append(duration_ms)
+
+    def bucket_index(self, duration_ms):
+        for index, upper_bound in enumerate(self.buckets_ms):
+            if duration_ms <= upper_bound:
+                return index
+        return len(self.buckets_ms)
+
+    def record_item(self):
+        with self.lock:
+            self.items += 1
+
+    def items_per_minute(self):
+        # Items sold per minute spent in the sell process, idle time between key presses excluded.
+        with self.lock:
+            process = self.stages.get('process')
+            if process is None or process['total_ms'] == 0:
+                return 0.0
+            return self.items / (process['total_ms'] / 60000)
+
+    def summary(self):
+        """
+        Returns:
+        dict: For each stage, its call count, total, p50, p95, p99 and maximum duration in milliseconds.
+        """
+        with self.lock:
+            stages = {stage: (entry['count'], entry['total_ms'], entry['max_ms'], list(entry['samples']))
+                      for stage, entry in self.stages.items()}
+
+        return {stage: {
+            'count': count,
+            'total_ms': total_ms,
+            'p50_ms': percentile(samples, 50),
+            'p95_ms': percentile(samples, 95),
+            'p99_ms': percentile(samples, 99),
+            'max_ms': max_ms,
+        } for stage, (count, total_ms, max_ms, samples) in stages.items()}
+
+    def histograms(self):
+        with self.lock:
+            return {stage: list(entry['buckets']) for stage, entry in self.stages.items()}
+
+    def bucket_labels(self):
+        return [f'le_{upper_bound}ms' for upper_bound in self.buckets_ms] + ['le_inf']
+
+    def export_json(self, path):
+        histograms = self.histograms()
+        data = {
+            'items': self.items,
+            'items_per_minute': self.items_per_minute(),
+            'buckets_ms': list(self.buckets_ms),
+            'stages': {stage: dict(values, buckets=histograms[stage]) for stage, values in self.summary().items()},
+        }
+        with open(path, 'w') as json_file:
+            json.dump(data, json_file, indent=4)
+
+    def export_csv(self, path):
+        columns = ['count', 'total_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+        histograms = self.histograms()
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['stage'] + columns + self.bucket_labels())
+            for stage, values in sorted(self.summary().items()):
+                writer.writerow([stage] + [round(values[column], 3) for column in columns] + histograms[stage])
+
+    def export(self, folder):
+        # Writes timings.json and timings.csv to folder, and returns their paths.
+        os.makedirs(folder, exist_ok=True)
+        json_path, csv_path = os.path.join(folder, 'timings.json'), os.path.join(folder, 'timings.csv')
+        self.export_json(json_path)
+        self.export_csv(csv_path)
+        return json_path, csv_path
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.items = 0
+
+
+timings = StageTimings()
@@ -0,0 +1,91 @@
+import time
+import zlib
+
+import numpy as np
+
+from utils.constants import WAIT_POLL_INTERVAL, WAIT_HASH_STEP
+from utils.matching import match_template
+from utils.templates import template_store
+from utils.timing import timings
+from utils.window_context import get_window_context
+
+
+def region_hash(image):
+    """Cheap hash of an image, computed on every WAIT_HASH_STEP-th pixel of every WAIT_HASH_STEP-th line."""
+    return zlib.crc32(np.ascontiguousarray(image[::WAIT_HASH_STEP, ::WAIT_HASH_STEP]))
+
+
+def grab_hash(region, grab=None):
+    # Grabs through the current window context, or through grab if given.
+    return region_hash((grab or get_window_context().grab)(region))
+
+
+@timings.timed('wait_stable')
+def wait_until_stable(region, timeout, reference=None, interval=WAIT_POLL_INTERVAL, grab=None):
+    """
+    Wait until two consecutive captures of the region are identical. grab, if given, is used to capture it,
+    see grab_hash.
+
+    Returns:
+    bool: True if the region became stable before the timeout.
+    """
+    deadline = time.perf_counter() + timeout
+    if reference is None:
+        reference = grab_hash(region, grab)
+
+    while time.perf_counter() < deadline:
+        time.sleep(interval)
+        current = grab_hash(region, grab)
+        if current == reference:
+            return True
+        reference = current
+    return False
+
+
+@timings.timed('wait_change')
+def wait_for_change(region, timeout, reference=None, settle=True, interval=WAIT_POLL_INTERVAL):
+    """
+    Wait until the region differs from its reference hash, then, if settle is set, until it is done redrawing.
+
+    Args:
+    region (tuple): The (x, y, w, h) screen region to watch, or None for the whole screen.
+    reference (int): The region_hash of the region before the change. Captured now if not given, which is
+    only correct if the change cannot have started yet.
+
+    Returns:
+    bool: True if the region changed before the timeout.
+    """
+    deadline = time.perf_counter() + timeout
+    if reference is None:
+        reference = grab_hash(region)
+
+    while time.perf_counter() < deadline:
+        time.sleep(interval)
+        current = grab_hash(region)
+        if current != reference:
+            if settle:
+                wait_until_stable(region, max(0.0, deadline - time.perf_counter()), current, interval)
+            return True
+    return False
+
+
+@timings.timed('wait_cue')
+def wait_for_cue(template_path, region, size, window_size, timeout, threshold, interval=WAIT_POLL_INTERVAL):
+    """
+    Wait until the template, resized to size, appears in the region.
+
+    Returns:
+    tuple: The location of the template in screen coordinates, or None if it did not appear before the timeout.
+    """
+    template = template_store.get_scaled(template_path, size, window_size)
+    if template is None:
+        return None
+
+    deadline = time.perf_counter() + timeout
+    while True:
+        score, loc = match_template(get_window_context().grab(region), template)
+        if loc is not None and score >= threshold:
+            return loc[0] + region[0], loc[1] + region[1]
+        if time.perf_counter() >= deadline:
+            return None
+        time.sleep(interval)
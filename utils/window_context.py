@@ -0,0 +1,182 @@
+import functools
+import threading
+import time
+
+from utils.capture import get_capture
+from utils.constants import FOCUS_SWITCH_TIMEOUT
+from utils.data_classes import Coordinates
+from utils.debug_utils import debug_print
+from utils.helpers import WindowTracker, get_window_backend, is_game_window_open_and_focused, \
+    set_thread_window_tracker
+from utils.input import SerializedInput
+from utils.timing import StageTimings, timings
+from utils.worker import Worker
+
+
+class WindowContext:
+    """
+    What the sell process knows about one game client: where its elements are, the areas derived from them,
+    its own metrics, and the worker thread its sells run on.
+
+    Sells on different clients run on their own workers, so they can be captured and recognized at the same
+    time, while their input is serialized. The default context, without a window, follows the first game
+    window found, as when a single client is open or in headless runs. It has no worker.
+
+    The sell process of a context stops at its next stage boundary once cancel_event is set, see abort().
+    """
+
+    def __init__(self, window=None, tracker=None, name='default'):
+        self.window = window
+        self.tracker = tracker
+        self.name = name
+        self.element_coordinates = {}
+        self.price_table_area = Coordinates(0, 0, 0, 0)
+        self.sell_button_area = Coordinates(0, 0, 0, 0)
+        self.oui_button_area = Coordinates(0, 0, 0, 0)
+        self.layout_window_size = None
+        self.layout_future = None
+        self.timings = StageTimings()
+        self.input = SerializedInput(prepare=self.prepare_input, focus=self.focus)
+        # Set while a hotkey job has not sent its first input yet
+        self.pressed_at = None
+        self.cancel_event = threading.Event()
+        self.worker = None
+        if window is not None:
+            self.worker = Worker(name, cancel_event=self.cancel_event)
+
+    def reset(self):
+        self.element_coordinates = {}
+        self.price_table_area = Coordinates(0, 0, 0, 0)
+        self.sell_button_area = Coordinates(0, 0, 0, 0)
+        self.oui_button_area = Coordinates(0, 0, 0, 0)
+        self.layout_window_size = None
+
+    def focus(self):
+        """
+        Bring the client of this context to the front, unless it was the last one brought there and still is,
+        and wait for it to be drawn there.
+
+        Only called while the input dispatch lock is held, so no other client can be focused meanwhile.
+        """
+        global front_context
+        if self.tracker is None or (front_context is self and self.tracker.is_focused()):
+            return
+
+        front_context = self
+        if self.tracker.activate(FOCUS_SWITCH_TIMEOUT):
+            # Imported here, as the waiter grabs through the window contexts
+            from utils.waiter import wait_until_stable
+            client_rect = self.tracker.get_client_rect() or self.tracker.get_rect()
+            wait_until_stable(client_rect, FOCUS_SWITCH_TIMEOUT, grab=get_capture().grab)
+
+    def prepare_input(self):
+        # Input goes to the focused window: another client may have been focused since the last batch.
+        self.focus()
+
+        if self.pressed_at is not None:
+            latency = time.perf_counter() - self.pressed_at
+            self.pressed_at = None
+            timings.record('first_action', latency)
+            self.timings.record('first_action', latency)
+
+    def grab(self, region=None):
+        # Grabs the screen, or a (x, y, w, h) region of it. Clients may overlap, so the client of this context
+        # is brought to the front first, and kept there until the grab is done, like for input.
+        # Grabs are backed by buffers reused by later grabs of the same size, which other clients may take
+        # while this one still reads its frame, so they are copied when several clients are tracked.
+        if self.tracker is None:
+            return get_capture().grab(region)
+        with self.input.focused():
+            image = get_capture().grab(region)
+            return image.copy() if len(window_contexts) > 1 else image
+
+    def is_aborted(self):
+        return self.cancel_event.is_set()
+
+    def abort(self):
+        # Drops the hotkey presses waiting and stops the running sell. Returns whether there was anything to stop.
+        # The default context has no hotkey jobs to abort.
+        return self.worker is not None and self.worker.abort()
+
+    def is_open(self):
+        if self.tracker is None:
+            return is_game_window_open_and_focused()
+        # Focus was checked when the hotkey was pressed, and input focuses the window back if needed
+        return self.tracker.get_size()[0] is not None
+
+    def bind(self, function):
+        # Wraps function to run with this context as the current one, e.g. in another thread.
+        @functools.wraps(function)
+        def bound_function(*args, **kwargs):
+            previous = getattr(current, 'context', None)
+            use_window_context(self)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                use_window_context(previous)
+
+        return bound_function
+
+    def submit(self, function, *args, key=None, policy='queue'):
+        # Queues function on the worker of this context, see Worker.submit. Errors are reported, as nothing
+        # waits for the result.
+        future = self.worker.submit(self.bind(function), *args, key=key, policy=policy)
+        if future is not None:
+            future.add_done_callback(self.report_error)
+        return future
+
+    def report_error(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            debug_print(f"Error on game window {self.name}: {future.exception()!r}")
+
+
+current = threading.local()
+default_context = WindowContext()
+# The context whose client was last brought to the front, see WindowContext.focus
+front_context = None
+window_contexts = {}
+window_contexts_lock = threading.Lock()
+
+
+def use_window_context(context):
+    # Sets the current context of the calling thread, or the default one for None.
+    current.context = context
+    set_thread_window_tracker(context.tracker if context is not None else None)
+
+
+def get_window_context():
+    context = getattr(current, 'context', None)
+    return context if context is not None else default_context
+
+
+def get_focused_window_context():
+    # Returns the context of the focused game window, created on first use, or None if no game window is focused.
+    backend = get_window_backend()
+    window = backend.get_focused_game_window()
+    if window is None:
+        return None
+
+    key = (id(backend), backend.get_window_id(window))
+    with window_contexts_lock:
+        context = window_contexts.get(key)
+        if context is None:
+            name = backend.get_window_name(window)
+            context = WindowContext(window, WindowTracker(backend, window=window), name=name)
+            window_contexts[key] = context
+            debug_print(f"Tracking game window {name}.")
+        return context
+
+
+def abort_window_contexts():
+    # Returns whether a sell was running or waiting on any game window.
+    with window_contexts_lock:
+        contexts = list(window_contexts.values())
+    aborted = [context.abort() for context in contexts]
+    return any(aborted)
+
+
+def reset_window_contexts():
+    default_context.reset()
+    with window_contexts_lock:
+        for context in window_contexts.values():
+            context.reset()
@@ -0,0 +1,93 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from utils.config import config_store
+from utils.constants import HOTKEY_QUEUE_POLICY_KEY, HOTKEY_QUEUE_POLICIES, DEFAULT_HOTKEY_QUEUE_POLICY, \
+    HOTKEY_QUEUE_SIZE
+from utils.debug_utils import debug_print
+
+
+def get_queue_policy():
+    # Returns the hotkey queue policy selected in the config, or the default one if it does not exist.
+    policy = config_store.get(HOTKEY_QUEUE_POLICY_KEY) or DEFAULT_HOTKEY_QUEUE_POLICY
+    if policy not in HOTKEY_QUEUE_POLICIES:
+        debug_print(f"Unknown hotkey queue policy {policy}, using {DEFAULT_HOTKEY_QUEUE_POLICY}.")
+        policy = DEFAULT_HOTKEY_QUEUE_POLICY
+    return policy
+
+
+class Worker:
+    """
+    Runs jobs one at a time on its own thread, in the order they were submitted.
+
+    Jobs submitted for a hotkey, with a key, follow a queue policy while another hotkey job is running or
+    waiting: 'drop' ignores the new press, 'coalesce' ignores it only if the same hotkey is already waiting,
+    and 'queue' keeps up to max_pending presses waiting.
+
+    abort() drops the waiting jobs and sets cancel_event, which the running job checks at its own stage
+    boundaries. The event is cleared when the next job starts.
+    """
+
+    def __init__(self, name, cancel_event=None, max_pending=HOTKEY_QUEUE_SIZE):
+        self.name = name
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.running = False
+        self.running_key = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name=f'worker-{name}', daemon=True)
+        self.thread.start()
+
+    def accepts(self, key, policy):
+        waiting_keys = [job_key for job_key, _, _, _ in self.pending if job_key is not None]
+        if policy == 'drop':
+            return self.running_key is None and not waiting_keys
+        if policy == 'coalesce':
+            return key not in waiting_keys
+        return len(waiting_keys) < self.max_pending
+
+    def submit(self, function, *args, key=None, policy='queue'):
+        # Returns the future of the job, or None if the queue policy ignored it.
+        with self.condition:
+            if key is not None and not self.accepts(key, policy):
+                debug_print(f"{self.name}: {key} ignored, already busy ({policy} policy).")
+                return None
+            future = Future()
+            self.pending.append((key, function, args, future))
+            self.condition.notify()
+        return future
+
+    def abort(self):
+        # Returns whether a job was running or waiting.
+        with self.condition:
+            dropped = list(self.pending)
+            self.pending.clear()
+            busy = self.running or bool(dropped)
+            self.cancel_event.set()
+
+        for _, _, _, future in dropped:
+            future.cancel()
+        return busy
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                key, function, args, future = self.pending.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.running, self.running_key = True, key
+                self.cancel_event.clear()
+
+            try:
+                result = function(*args)
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            finally:
+                with self.condition:
+                    self.running, self.running_key = False, None